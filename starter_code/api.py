@@ -0,0 +1,285 @@
+from datetime import datetime
+
+from flask import Blueprint, abort, current_app, g, jsonify, request, url_for
+from werkzeug.exceptions import HTTPException
+
+from dates import localize
+from models import db, Artist, Show, Venue, SHOW_CARD
+
+# ----------------------------------------------------------------------------#
+# Versioned JSON read API.
+#
+#   GET /api/v1/venues?ids=1,2,3&fields=id,name,upcoming_shows
+#   GET /api/v1/artists?after=40&limit=20
+#   GET /api/v1/shows?ids=7,8&fields=start_time,venue,artist
+#   GET /api/v1/shows?venue_id=3&when=past&cursor=2026-03-01T20:00:00_120
+#
+# Related rows are fetched through per-request loaders that gather the ids a
+# response needs and resolve them with a single IN (...) query each. A venue
+# or artist lists at most API_SHOWS_PER_OWNER upcoming and past shows (the
+# next and the latest), with a link to the /shows listing of the rest.
+# ----------------------------------------------------------------------------#
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+class Loader(object):
+    # Batches lookups by key and caches the results for the request
+
+    def __init__(self, batch):
+        # batch takes a list of keys and returns {key: value}
+        self._batch = batch
+        self._cache = {}
+
+    def load_many(self, keys):
+        missing = [key for key in dict.fromkeys(keys) if key not in self._cache]
+        if missing:
+            found = self._batch(missing)
+            for key in missing:
+                self._cache[key] = found.get(key)
+        return {key: self._cache[key] for key in keys}
+
+
+def _shows_by(column, owner):
+    # {owner id: [SHOW_CARD views]} of the next and the latest
+    # API_SHOWS_PER_OWNER + 1 shows of each owner, in start order; the one
+    # over tells that there are more
+    def batch(ids):
+        now = datetime.now()
+        past = Show.start_time < now
+        nearest = db.func.row_number().over(
+            partition_by=(column, past),
+            order_by=(db.case((past, Show.start_time)).desc(), Show.start_time))
+        ranked = db.select(Show.id, nearest.label('nearest')).filter(
+            column.in_(ids), Show.start_time.isnot(None), Show.start_time != now).subquery()
+        kept = db.select(ranked.c.id).filter(
+            ranked.c.nearest <= current_app.config['API_SHOWS_PER_OWNER'] + 1)
+        shows = {}
+        for show in SHOW_CARD.views(db.session.execute(Show.with_artist_venue(
+                Show.id.in_(kept)).order_by(Show.start_time, Show.id))):
+            shows.setdefault(getattr(show, owner).id, []).append(show)
+        return shows
+    return batch
+
+
+def _by_id(model):
+    def batch(ids):
+        return {row.id: row for row in model.query.options(db.lazyload('*')).filter(
+            model.id.in_(ids))}
+    return batch
+
+
+def loader(name):
+    if 'loaders' not in g:
+        g.loaders = {
+            'venue_shows': Loader(_shows_by(Show.venue_id, 'venue')),
+            'artist_shows': Loader(_shows_by(Show.artist_id, 'artist')),
+            'venues': Loader(_by_id(Venue)),
+            'artists': Loader(_by_id(Artist)),
+        }
+    return g.loaders[name]
+
+
+def _time(value):
+    # ISO 8601 with the offset of the zone show times are entered in
+    if value is None:
+        return None
+    return localize(value, current_app.config['SHOW_TIMEZONE']).isoformat()
+
+
+def _show_with_artist(show):
+    return {'id': show.id,
+            'start_time': _time(show.start_time),
+            'artist_id': show.artist.id,
+            'artist_name': show.artist.name,
+            'artist_image_link': show.artist.image_link}
+
+
+def _show_with_venue(show):
+    return {'id': show.id,
+            'start_time': _time(show.start_time),
+            'venue_id': show.venue.id,
+            'venue_name': show.venue.name,
+            'venue_image_link': show.venue.image_link}
+
+
+# Fills in the upcoming_shows and past_shows of item from the shows loaded
+# for it, with links to the rest when there are more
+def _add_shows(item, shows, serialize, **owner):
+    now = datetime.now()
+    limit = current_app.config['API_SHOWS_PER_OWNER']
+    upcoming = [show for show in shows if show.start_time > now]
+    past = [show for show in shows if show.start_time < now]
+    for when, listed in (('upcoming', upcoming[:limit]), ('past', past[-limit:])):
+        item[when + '_shows'] = [serialize(show) for show in listed]
+        item[when + '_shows_more'] = None
+    if len(upcoming) > limit:
+        item['upcoming_shows_more'] = url_for('api_v1.collection', resource='shows', when='upcoming',
+                                              cursor=upcoming[limit - 1].cursor, **owner)
+    if len(past) > limit:
+        item['past_shows_more'] = url_for('api_v1.collection', resource='shows', when='past',
+                                          cursor=past[-limit].cursor, **owner)
+
+
+def _venue_fields(venues, fields):
+    shows = {}
+    if fields & {'upcoming_shows', 'past_shows'}:
+        shows = loader('venue_shows').load_many([venue.id for venue in venues])
+    data = []
+    for venue in venues:
+        item = {'id': venue.id,
+                'name': venue.name,
+                'city': venue.city,
+                'state': venue.state,
+                'address': venue.address,
+                'phone': venue.phone,
+                'website': venue.website_link,
+                'image_link': venue.image_link,
+                'facebook_link': venue.facebook_link,
+                'seeking_talent': venue.seeking_talent,
+                'seeking_description': venue.seeking_description,
+                'upcoming_shows_count': venue.upcoming_shows_count,
+                'past_shows_count': venue.past_shows_count} if fields - {'genres'} else {}
+        if 'genres' in fields:
+            item['genres'] = [genre.name for genre in venue.genres]
+        if venue.id in shows:
+            _add_shows(item, shows[venue.id] or [], _show_with_artist, venue_id=venue.id)
+        data.append(item)
+    return data
+
+
+def _artist_fields(artists, fields):
+    shows = {}
+    if fields & {'upcoming_shows', 'past_shows'}:
+        shows = loader('artist_shows').load_many([artist.id for artist in artists])
+    data = []
+    for artist in artists:
+        item = {'id': artist.id,
+                'name': artist.name,
+                'city': artist.city,
+                'state': artist.state,
+                'phone': artist.phone,
+                'website': artist.website_link,
+                'image_link': artist.image_link,
+                'facebook_link': artist.facebook_link,
+                'seeking_venue': artist.seeking_venue,
+                'seeking_description': artist.seeking_description,
+                'upcoming_shows_count': artist.upcoming_shows_count,
+                'past_shows_count': artist.past_shows_count} if fields - {'genres'} else {}
+        if 'genres' in fields:
+            item['genres'] = [genre.name for genre in artist.genres]
+        if artist.id in shows:
+            _add_shows(item, shows[artist.id] or [], _show_with_venue, artist_id=artist.id)
+        data.append(item)
+    return data
+
+
+def _show_fields(shows, fields):
+    venues = artists = {}
+    if 'venue' in fields:
+        venues = loader('venues').load_many([show.venue_id for show in shows])
+    if 'artist' in fields:
+        artists = loader('artists').load_many([show.artist_id for show in shows])
+    data = []
+    for show in shows:
+        item = {'id': show.id,
+                'start_time': _time(show.start_time),
+                'end_time': _time(show.end_time),
+                'venue_id': show.venue_id,
+                'artist_id': show.artist_id}
+        if show.venue_id in venues:
+            item['venue'] = {'id': show.venue_id, 'name': venues[show.venue_id].name,
+                             'image_link': venues[show.venue_id].image_link}
+        if show.artist_id in artists:
+            item['artist'] = {'id': show.artist_id, 'name': artists[show.artist_id].name,
+                              'image_link': artists[show.artist_id].image_link}
+        data.append(item)
+    return data
+
+
+# Links to the rest of a list, returned along with it
+LINKS = {'upcoming_shows_more': 'upcoming_shows', 'past_shows_more': 'past_shows'}
+
+# model, serializer, fields it can return, fields returned by default
+RESOURCES = {
+    'venues': (Venue, _venue_fields,
+               {'id', 'name', 'city', 'state', 'address', 'phone', 'website', 'image_link',
+                'facebook_link', 'seeking_talent', 'seeking_description', 'genres',
+                'upcoming_shows_count', 'past_shows_count', 'upcoming_shows', 'past_shows'},
+               {'id', 'name', 'city', 'state', 'genres'}),
+    'artists': (Artist, _artist_fields,
+                {'id', 'name', 'city', 'state', 'phone', 'website', 'image_link',
+                 'facebook_link', 'seeking_venue', 'seeking_description', 'genres',
+                 'upcoming_shows_count', 'past_shows_count', 'upcoming_shows', 'past_shows'},
+                {'id', 'name', 'city', 'state', 'genres'}),
+    'shows': (Show, _show_fields,
+              {'id', 'start_time', 'end_time', 'venue_id', 'artist_id', 'venue', 'artist'},
+              {'id', 'start_time', 'venue_id', 'artist_id'}),
+}
+
+
+def _int_list(value):
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        abort(400, 'ids must be a comma separated list of integers')
+
+
+@api.route('/<any(venues, artists, shows):resource>')
+def collection(resource):
+    model, serialize, allowed, default = RESOURCES[resource]
+    fields = set(filter(None, request.args.get('fields', '').split(','))) or default
+    if fields - allowed:
+        abort(400, 'unknown fields: ' + ', '.join(sorted(fields - allowed)))
+
+    query = model.query
+    if resource != 'shows' and 'genres' not in fields:
+        query = query.options(db.lazyload(model.genres))
+    limit = min(max(request.args.get('limit', 20, type=int), 1),
+                current_app.config['API_MAX_IDS'])
+    next_cursor = None
+    if resource == 'shows' and request.args.keys() & {'venue_id', 'artist_id', 'when'}:
+        # the shows of a venue or artist, as /shows lists them
+        when = request.args.get('when')
+        if when not in (None, 'upcoming', 'past'):
+            abort(400, 'when must be upcoming or past')
+        try:
+            cursor = request.args.get('cursor')
+            cursor = Show.decode_cursor(cursor) if cursor else None
+        except ValueError:
+            abort(400, 'bad cursor')
+        for name in ('venue_id', 'artist_id'):
+            if name in request.args:
+                owner_id = request.args.get(name, type=int)
+                if owner_id is None:
+                    abort(400, name + ' must be an integer')
+                query = query.filter(getattr(Show, name) == owner_id)
+        rows = Show.in_listing_order(query.filter(Show.start_time.isnot(None)), cursor,
+                                     when).limit(limit).all()
+        next_after = None
+        if len(rows) == limit:
+            next_cursor = '{}_{}'.format(rows[-1].start_time.isoformat(), rows[-1].id)
+    elif 'ids' in request.args:
+        ids = _int_list(request.args['ids'])
+        if len(ids) > current_app.config['API_MAX_IDS']:
+            abort(400, 'at most {} ids per request'.format(current_app.config['API_MAX_IDS']))
+        found = {row.id: row for row in query.filter(model.id.in_(ids))}
+        rows = [found[row_id] for row_id in dict.fromkeys(ids) if row_id in found]
+        next_after = None
+    else:
+        after = request.args.get('after', 0, type=int)
+        rows = query.filter(model.id > after).order_by(model.id).limit(limit).all()
+        next_after = rows[-1].id if len(rows) == limit else None
+
+    data = serialize(rows, fields)
+    # drop what the client did not ask for
+    data = [{key: value for key, value in item.items()
+             if key in fields or LINKS.get(key) in fields} for item in data]
+    response = {'data': data, 'next_after': next_after}
+    if next_cursor is not None:
+        response['next_cursor'] = next_cursor
+    return jsonify(response)
+
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    return jsonify({'error': error.description, 'status': error.code}), error.code
@@ -0,0 +1,13 @@
+# ----------------------------------------------------------------------------#
+# Entry point for ASGI servers:
+#
+#   $ uvicorn asgi:app
+#   $ gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi:app
+#
+# The read pages are served by the async views in async_views.py, every
+# other route by the same Flask app as wsgi.py.
+# ----------------------------------------------------------------------------#
+from app import create_app
+from async_views import AsyncApp
+
+app = AsyncApp(create_app(commands=False))
@@ -0,0 +1,376 @@
+import asyncio
+import sys
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from flask import abort, current_app, g, render_template, request, request_started
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+import database
+from cache import page_cache
+from models import db, Artist, Genre, Show, Venue, ARTIST_PAGE, SHOW_CARD, VENUE_PAGE
+from replicas import replica_router
+from search import ensure_sqlite_index, search_page, search_statements
+from views import cached_letter_buckets, listing_arguments, store_letter_buckets
+
+
+# ----------------------------------------------------------------------------#
+# Async serving of the read pages.
+#
+# Under an ASGI server (see asgi.py) the venue, artist and show pages and the
+# searches are served by the coroutines below, which query through asyncio
+# drivers (asyncpg, aiosqlite) instead of holding a thread each while the
+# database works. The queries of a page run one after the other on a single
+# session, so a request holds at most one connection of the pool, as it does
+# under WSGI. Every other route, the forms included, is the unchanged Flask
+# app run on a worker thread.
+#
+# The async views run inside a Flask request context, with the app's
+# before/after request hooks, error handlers, page cache and replica routing,
+# and render the same templates as their sync counterparts.
+# ----------------------------------------------------------------------------#
+class AsyncDatabase(object):
+
+    def __init__(self):
+        self.app = None
+        self.engines = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.engines = {}
+        app.extensions['async_db'] = self
+
+    def engine(self, bind=None):
+        # Engines are made on first use, inside the worker's event loop. The
+        # pool settings are the DB_* ones of the sync engines; connect
+        # arguments are rebuilt for the async driver.
+        if bind not in self.engines:
+            uri = database.async_uri(db.engines[bind].url)
+            self.engines[bind] = create_async_engine(
+                uri, **database.engine_options(dict(self.app.config, SQLALCHEMY_DATABASE_URI=uri)))
+        return self.engines[bind]
+
+    async def dispose(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.engines = {}
+
+    async def session(self):
+        # The session of this request, on a replica's engine when replicas.py
+        # would route its reads there, else on the primary's
+        if 'async_session' not in g:
+            engine = self.engine()
+            if replica_router.reads_from_replica():
+                # the health checks run on the sync engines
+                await asyncio.to_thread(replica_router.choose, db.engines)
+                if g.db_replica is not None:
+                    engine = self.engine(g.db_replica.name)
+            g.async_session = AsyncSession(engine)
+        return g.async_session
+
+    async def close(self):
+        session = g.pop('async_session', None)
+        if session is not None:
+            await session.close()
+
+    async def scalars(self, statement):
+        return (await (await self.session()).scalars(statement)).all()
+
+    async def scalar(self, statement):
+        return await (await self.session()).scalar(statement)
+
+    async def all(self, statement):
+        return (await (await self.session()).execute(statement)).all()
+
+
+async_db = AsyncDatabase()
+
+
+# (upcoming, past) SHOW_CARD views of the shows matching criterion, read in
+# one query as Show.upcoming_and_past() does
+async def upcoming_and_past(*criterion):
+    return Show.split_upcoming_past(SHOW_CARD.views(await async_db.all(
+        Show.with_artist_venue(*criterion).order_by(Show.start_time))))
+
+
+# The page view of a venue or artist with its genres and shows, or None
+async def details(model, shape, owner_id, show_owner):
+    owner = shape.first(await async_db.all(shape.select().filter(model.id == owner_id)))
+    if owner is not None:
+        owner.genres = await async_db.scalars(Genre.names_query(model, owner_id))
+        owner.upcoming_shows, owner.past_shows = await upcoming_and_past(show_owner == owner_id)
+    return owner
+
+
+async def search_results(model):
+    search_term = request.form.get('search_term', '')
+    page = max(request.form.get('page', 1, type=int), 1)
+    per_page = current_app.config['SEARCH_PER_PAGE']
+    dialect = db.engine.dialect.name
+    matches, count, estimated = [], 0, False
+    statements = search_statements(dialect, model, search_term, page, per_page)
+    if statements is not None:
+        matches_query, count_query = statements
+        if dialect == 'sqlite':
+            await asyncio.to_thread(ensure_sqlite_index, model)
+        rows = await async_db.all(matches_query)
+        count = await async_db.scalar(count_query)
+        matches, count, estimated = search_page(model, rows, count, page, per_page)
+    response = {
+        "count": count,
+        "estimated": estimated,
+        "data": matches
+    }
+    return response, search_term, page
+
+
+# ----------------------------------------------------------------------------#
+# Views, by the endpoint of the sync view they stand in for.
+# ----------------------------------------------------------------------------#
+@page_cache.cached('venues', args=('page',))
+async def venues():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['AREAS_PER_PAGE']
+    data, has_next = Venue.group_areas(
+        await async_db.all(Venue.areas_query(page, per_page)), per_page)
+    return render_template('pages/venues.html', areas=data, page=page, has_next=has_next)
+
+
+async def search_venues():
+    response, search_term, page = await search_results(Venue)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term, page=page)
+
+
+@page_cache.cached('venue:{venue_id}')
+async def show_venue(venue_id):
+    venue = await details(Venue, VENUE_PAGE, venue_id, Show.venue_id)
+
+    if venue is None:
+        abort(404)
+
+    page_cache.add_tags('artist:{}'.format(show.artist.id)
+                        for show in venue.upcoming_shows + venue.past_shows)
+    return render_template('pages/show_venue.html', venue=venue)
+
+
+@page_cache.cached('artists', args=('letter', 'after'))
+async def artists():
+    letter = request.args.get('letter', '')[:1]
+    try:
+        after = request.args.get('after')
+        after = Artist.decode_cursor(after) if after else None
+    except ValueError:
+        abort(400)
+    per_page = current_app.config['ARTISTS_PER_PAGE']
+    data = await async_db.all(Artist.index_query(after, letter, per_page))
+    letters, versions = cached_letter_buckets()
+    if letters is None:
+        letters = store_letter_buckets(
+            await async_db.all(Artist.letter_buckets_query()), versions)
+    next_cursor = None
+    if len(data) == per_page:
+        next_cursor = Artist.encode_cursor(data[-1].name, data[-1].id)
+    return render_template('pages/artists.html', artists=data, letter=letter,
+                           letters=letters, next_cursor=next_cursor)
+
+
+async def search_artists():
+    response, search_term, page = await search_results(Artist)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term, page=page)
+
+
+@page_cache.cached('artist:{artist_id}')
+async def show_artist(artist_id):
+    artist = await details(Artist, ARTIST_PAGE, artist_id, Show.artist_id)
+
+    if artist is None:
+        abort(404)
+
+    page_cache.add_tags('venue:{}'.format(show.venue.id)
+                        for show in artist.upcoming_shows + artist.past_shows)
+    return render_template('pages/show_artist.html', artist=artist)
+
+
+@page_cache.cached('shows', args=('when', 'from', 'to', 'per_page', 'stream', 'after'))
+async def shows():
+    filters, after, start, end, per_page = listing_arguments()
+    data = SHOW_CARD.views(await async_db.all(
+        Show.listing(after, filters.get('when'), start, end).limit(per_page)))
+    return render_template('pages/shows.html', shows=data, per_page=per_page, filters=filters)
+
+
+ASYNC_VIEWS = {
+    'pages.venues': venues,
+    'pages.search_venues': search_venues,
+    'pages.show_venue': show_venue,
+    'pages.artists': artists,
+    'pages.search_artists': search_artists,
+    'pages.show_artist': show_artist,
+    'pages.shows': shows,
+}
+
+
+# ----------------------------------------------------------------------------#
+# ASGI application.
+# ----------------------------------------------------------------------------#
+class AsyncApp(object):
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        async_db.init_app(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type {!r}'.format(scope['type']))
+
+        environ = wsgi_environ(scope)
+        environ['wsgi.input'] = BytesIO(await read_body(receive))
+        # the whole body is read: the input ends where it does
+        environ['wsgi.input_terminated'] = True
+        view = self.async_view(environ)
+        if view is None:
+            await self.run_wsgi(environ, send)
+            return
+        response = await self.dispatch(environ, view)
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': encode_headers(response.get_wsgi_headers(environ).items())})
+        try:
+            for chunk in response.get_app_iter(environ):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def async_view(self, environ):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        # streamed show listings keep using the sync server-side cursor
+        if endpoint == 'pages.shows' and any(parse_qs(environ['QUERY_STRING']).get('stream', [])):
+            return None
+        return ASYNC_VIEWS.get(endpoint)
+
+    async def dispatch(self, environ, view):
+        # Flask.wsgi_app and full_dispatch_request, with the view awaited
+        app = self.flask_app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                try:
+                    request_started.send(app)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        try:
+                            rv = await view(**request.view_args)
+                        finally:
+                            await async_db.close()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                return app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                return app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+    async def run_wsgi(self, environ, send):
+        # The Flask app on a thread of the loop's default executor. The
+        # response body is iterated there too, so streamed pages go out as
+        # they render.
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                started[:] = [int(status.split(' ', 1)[0]), headers]
+
+            def start():
+                if started:
+                    status, headers = started
+                    send_from_thread({'type': 'http.response.start', 'status': status,
+                                      'headers': encode_headers(headers)})
+                    started[:] = []
+
+            body = self.flask_app(environ, start_response)
+            try:
+                for chunk in body:
+                    start()
+                    if chunk:
+                        send_from_thread({'type': 'http.response.body', 'body': chunk,
+                                          'more_body': True})
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            start()
+            send_from_thread({'type': 'http.response.body', 'body': b''})
+
+        await loop.run_in_executor(None, run)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def wsgi_environ(scope):
+    # The WSGI environ of an ASGI http request, without its body
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(body)
+
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers]
@@ -0,0 +1,6 @@
+# ----------------------------------------------------------------------------#
+# Synthetic dataset generator and per-route benchmarks.
+#
+#   $ python -m benchmark --database sqlite:///bench.db --output run.json
+#   $ python -m benchmark --database sqlite:///bench.db --compare run.json
+# ----------------------------------------------------------------------------#
@@ -0,0 +1,82 @@
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmark',
+                                     description='Seed a database and time every route.')
+    parser.add_argument('--database', default='sqlite:///benchmark.db',
+                        help='SQLAlchemy URI of the database to seed and query')
+    parser.add_argument('--venues', type=int, default=100)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reseed', action='store_true',
+                        help='drop and recreate the tables before seeding')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--startup-runs', type=int, default=5,
+                        help='fresh processes started to time app startup (0 to skip)')
+    parser.add_argument('--cache', action='store_true',
+                        help='leave the page cache on (off by default so every run hits the db)')
+    parser.add_argument('--output', '-o', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='results of an earlier run; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown against --compare (default 0.25)')
+    args = parser.parse_args()
+
+    from app import create_app
+    from benchmark import dataset, runner
+    from models import db
+
+    app = create_app(commands=False, SQLALCHEMY_DATABASE_URI=args.database,
+                     WTF_CSRF_ENABLED=False, **({} if args.cache else {'CACHE_TYPE': 'null'}))
+
+    with app.app_context():
+        if args.reseed:
+            db.drop_all()
+        db.create_all()
+        if dataset.counts()['venues'] == 0:
+            print('Seeding {} venues, {} artists, {} shows (seed {})'.format(
+                args.venues, args.artists, args.shows, args.seed), file=sys.stderr)
+            dataset.generate(args.venues, args.artists, args.shows, args.seed)
+        counts = dataset.counts()
+        dialect = db.engine.dialect.name
+
+    routes = runner.run(app, args.iterations, args.warmup)
+    startup = runner.startup(args.database, args.startup_runs) if args.startup_runs else None
+    results = {'created': datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(),
+               'database': dialect,
+               'dataset': dict(counts, seed=args.seed),
+               'startup': startup,
+               'routes': routes}
+
+    print('{:<70} {:>6} {:>9} {:>9} {:>9}'.format('route', 'stmts', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for route, stats in routes.items():
+        print('{:<70} {:>6} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+            route[:70], stats['statements'], stats['p50_ms'], stats['p90_ms'], stats['p99_ms']))
+
+    if startup:
+        print('startup: {process_ms:.0f} ms to a first page ({import_ms:.0f} ms import, '
+              '{create_app_ms:.0f} ms create_app, {first_request_ms:.0f} ms first request)'.format(
+                  **startup))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = runner.compare(json.load(f), results, args.tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
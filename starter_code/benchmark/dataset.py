@@ -0,0 +1,83 @@
+import random
+from datetime import datetime, timedelta
+
+from forms import VenueForm
+from importer import insert_entities, insert_shows
+from models import db, Artist, Show, Venue
+
+# ----------------------------------------------------------------------------#
+# Deterministic synthetic data.
+#
+# The same seed and sizes always produce the same rows. Show times are laid
+# out around midnight of the current day, so roughly half of them are
+# upcoming whenever the data is generated.
+# ----------------------------------------------------------------------------#
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+CITIES = [('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+          ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL'),
+          ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Portland', 'OR')]
+WORDS = ['Blue', 'Velvet', 'Electric', 'Golden', 'Silent', 'Neon', 'Wild', 'Crimson',
+         'Lucky', 'Midnight', 'Iron', 'Paper', 'Echo', 'Hollow', 'Rusty', 'Silver']
+VENUE_NOUNS = ['Hall', 'Lounge', 'Room', 'Club', 'Tavern', 'Theatre', 'Garden', 'Bar']
+ARTIST_NOUNS = ['Horns', 'Kids', 'Band', 'Collective', 'Trio', 'Quartet', 'Riders', 'Ghosts']
+
+BATCH_SIZE = 1000
+
+
+def _name(rng, nouns, number):
+    # the number keeps names unique without hurting prefix searches
+    return 'The {} {} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), rng.choice(nouns), number)
+
+
+def _entity(rng, nouns, number):
+    city, state = rng.choice(CITIES)
+    return {'name': _name(rng, nouns, number),
+            'city': city,
+            'state': state,
+            'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999),
+                                                   rng.randint(0, 9999)),
+            'image_link': 'https://example.com/images/{}.jpg'.format(number),
+            'facebook_link': 'https://www.facebook.com/{}'.format(number),
+            'genres': rng.sample(GENRES, rng.randint(1, 3))}
+
+
+def _insert(model, association, records):
+    ids = []
+    for start in range(0, len(records), BATCH_SIZE):
+        ids.extend(insert_entities(model, association, records[start:start + BATCH_SIZE]))
+    return ids
+
+
+def generate(venues=100, artists=200, shows=1000, seed=1):
+    # Seeds the database bound to db.session and returns the row counts
+    rng = random.Random(seed)
+    venue_records = []
+    for number in range(venues):
+        record = _entity(rng, VENUE_NOUNS, number)
+        record['address'] = '{} {} St'.format(rng.randint(1, 2000), rng.choice(WORDS))
+        venue_records.append(record)
+    artist_records = [_entity(rng, ARTIST_NOUNS, number) for number in range(artists)]
+
+    venue_ids = _insert(Venue, Venue.genres.property.secondary, venue_records)
+    artist_ids = _insert(Artist, Artist.genres.property.secondary, artist_records)
+    db.session.commit()
+
+    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    # a few popular venues and artists get most of the shows, as in real data
+    venue_weights = [1.0 / (rank + 1) for rank in range(len(venue_ids))]
+    artist_weights = [1.0 / (rank + 1) for rank in range(len(artist_ids))]
+    for start in range(0, shows, BATCH_SIZE):
+        records = [{'venue_id': rng.choices(venue_ids, venue_weights)[0],
+                    'artist_id': rng.choices(artist_ids, artist_weights)[0],
+                    'start_time': midnight + timedelta(days=rng.randint(-365, 365),
+                                                       hours=rng.choice([18, 19, 20, 21, 22]))}
+                   for _ in range(min(BATCH_SIZE, shows - start))]
+        insert_shows(records)
+        db.session.commit()
+    return counts()
+
+
+def counts():
+    return {'venues': db.session.query(Venue).count(),
+            'artists': db.session.query(Artist).count(),
+            'shows': db.session.query(Show).count()}
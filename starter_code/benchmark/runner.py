@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import event
+
+from explain import ROUTES as EXPLAIN_ROUTES, sample_arguments
+from models import db
+
+# ----------------------------------------------------------------------------#
+# Times every route through the Flask test client and counts the SQL
+# statements each request issues.
+# ----------------------------------------------------------------------------#
+ROUTES = EXPLAIN_ROUTES + [
+    ('GET', '/', None),
+    ('GET', '/shows?stream=1', None),
+    ('GET', '/api/typeahead?kind=venue&q=the', None),
+    ('GET', '/api/v1/venues?ids={venue_ids}&fields=id,name,genres,upcoming_shows,past_shows', None),
+    ('GET', '/api/v1/artists?ids={artist_ids}&fields=id,name,genres,upcoming_shows,past_shows',
+     None),
+    ('GET', '/api/v1/shows?fields=id,start_time,venue,artist&limit=100', None),
+]
+
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: how long a new worker takes to import the app,
+# build it and serve its first page
+STARTUP_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(commands=False, SQLALCHEMY_DATABASE_URI={database!r}, CACHE_TYPE='null')
+created = time.perf_counter()
+app.test_client().get('/venues').get_data()
+served = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000,
+                  'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000}}))
+'''
+
+
+def percentile(samples, fraction):
+    # nearest rank on a sorted list
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def route_arguments():
+    arguments = sample_arguments()
+    arguments['venue_ids'] = ','.join(str(arguments['venue_id'] + offset) for offset in range(10))
+    arguments['artist_ids'] = ','.join(str(arguments['artist_id'] + offset)
+                                       for offset in range(10))
+    return arguments
+
+
+def run(app, iterations=20, warmup=2, routes=ROUTES):
+    # Returns {'METHOD path': stats} for every route
+    client = app.test_client()
+    results = {}
+    # each request must push its own app context (and so get its own
+    # session and g), so only look up the arguments inside one
+    with app.app_context():
+        arguments = route_arguments()
+        engine = db.engine
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for method, path, data in routes:
+            path = path.format(**arguments)
+            timings, counts, status = [], [], None
+            for number in range(warmup + iterations):
+                del statements[:]
+                started = time.perf_counter()
+                response = client.open(path, method=method, data=data)
+                # streamed bodies are only produced as they are read
+                response.get_data()
+                elapsed = time.perf_counter() - started
+                status = response.status_code
+                if number >= warmup:
+                    timings.append(elapsed * 1000)
+                    counts.append(len(statements))
+            timings.sort()
+            results['{} {}'.format(method, path)] = {
+                'status': status,
+                'iterations': iterations,
+                'statements': max(counts),
+                'min_ms': round(timings[0], 3),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+                'p50_ms': round(percentile(timings, 0.50), 3),
+                'p90_ms': round(percentile(timings, 0.90), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'max_ms': round(timings[-1], 3),
+            }
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return results
+
+
+def startup(database, runs=5):
+    # Median startup timings over runs fresh processes
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT.format(database=database)],
+                                cwd=APP_ROOT, check=True, capture_output=True, text=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return {key: round(percentile(sorted(sample[key] for sample in samples), 0.5), 1)
+            for key in samples[0]}
+
+
+def compare(previous, current, tolerance=0.25, floor_ms=1.0):
+    # Lines describing routes that issue more statements, or whose median got
+    # slower by more than tolerance and floor_ms (timer noise) together
+    regressions = []
+    for route, stats in sorted(current['routes'].items()):
+        before = previous.get('routes', {}).get(route)
+        if before is None:
+            continue
+        if stats['statements'] > before['statements']:
+            regressions.append('{}: {} statements, was {}'.format(
+                route, stats['statements'], before['statements']))
+        if stats['p50_ms'] > max(before['p50_ms'] * (1 + tolerance), before['p50_ms'] + floor_ms):
+            regressions.append('{}: p50 {:.1f}ms, was {:.1f}ms'.format(
+                route, stats['p50_ms'], before['p50_ms']))
+    before, after = previous.get('startup'), current.get('startup')
+    if before and after and after['process_ms'] > max(before['process_ms'] * (1 + tolerance),
+                                                      before['process_ms'] + floor_ms):
+        regressions.append('startup: {:.0f}ms, was {:.0f}ms'.format(
+            after['process_ms'], before['process_ms']))
+    return regressions
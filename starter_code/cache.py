@@ -0,0 +1,305 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import g, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+# ----------------------------------------------------------------------------#
+# Rendered page cache.
+#
+# Every entry is stored with the version of each tag it depends on (for
+# example 'venue:3' or 'shows'). Committing a change to a model bumps the
+# versions of the tags listed in its cache_tags property, which makes every
+# entry that recorded an older version stale. A version is the time of the
+# bump and a random part, see new_version().
+# ----------------------------------------------------------------------------#
+def new_version():
+    return '{:.6f}:{}'.format(time.time(), uuid.uuid4().hex)
+
+
+# The time a tag version was bumped at, 0 for a tag never bumped
+def bumped_at(version):
+    try:
+        return float(version.partition(':')[0])
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+class MemoryCache(object):
+    # Per-process LRU with a TTL
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tag_version(self, tag):
+        return self._tags.get(tag)
+
+    def bump(self, tag):
+        self._tags[tag] = new_version()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class FileCache(object):
+    # Entries and tag versions kept as files in a directory shared by all
+    # worker processes on the host. Every PRUNE_EVERY writes a process drops
+    # the expired entries and, past max_entries, the oldest ones.
+    PRUNE_EVERY = 64
+
+    def __init__(self, directory, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.directory = directory
+        self._writes = 0
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _write(self, path, data):
+        # write then rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            with open(self._path(self._name(key)), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, entry):
+        self._write(self._path(self._name(key)), pickle.dumps(entry))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        # entries are written with the same ttl, so the oldest files are the
+        # expired ones first
+        entries = []
+        for item in os.scandir(self.directory):
+            if item.is_file() and len(item.name) == 40:
+                try:
+                    entries.append((item.stat().st_mtime, item.path))
+                except OSError:
+                    pass
+        entries.sort()
+        expired = time.time() - self.ttl
+        excess = len(entries) - self.max_entries
+        for number, (mtime, path) in enumerate(entries):
+            if mtime >= expired and number >= excess:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(self._name(key)))
+        except OSError:
+            pass
+
+    def tag_version(self, tag):
+        try:
+            with open(self._path('tags', self._name(tag)), 'rb') as f:
+                return f.read().decode('ascii')
+        except OSError:
+            return None
+
+    def bump(self, tag):
+        self._write(self._path('tags', self._name(tag)), new_version().encode('ascii'))
+
+    def clear(self):
+        for directory in (self.directory, self._path('tags')):
+            for name in os.listdir(directory):
+                if os.path.isfile(os.path.join(directory, name)):
+                    os.remove(os.path.join(directory, name))
+
+
+class PageCache(object):
+
+    def __init__(self):
+        self.backend = None
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'invalidations': 0}
+        # called with (stat, amount) whenever a stat is counted
+        self.listeners = []
+
+    def _count(self, stat, amount=1):
+        self.stats[stat] += amount
+        for listener in self.listeners:
+            listener(stat, amount)
+
+    def init_app(self, app):
+        self.backend = None
+        kind = app.config.get('CACHE_TYPE', 'memory')
+        ttl = app.config.get('CACHE_TTL', 60)
+        if kind == 'memory':
+            self.backend = MemoryCache(ttl, app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif kind == 'file':
+            self.backend = FileCache(app.config['CACHE_DIR'], ttl,
+                                     app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif kind is not None and kind != 'null':
+            raise ValueError('Unknown CACHE_TYPE {!r}'.format(kind))
+        app.extensions['page_cache'] = self
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        expires, versions, value = entry
+        if expires < time.time() or any(
+                self.backend.tag_version(tag) != version for tag, version in versions.items()):
+            self._count('stale')
+            self.backend.delete(key)
+            return None
+        self._count('hits')
+        return value
+
+    def versions(self, tags):
+        return {tag: self.backend.tag_version(tag) for tag in tags}
+
+    # Stores value under the tag versions it was read at: taken before the
+    # reads, so that a change committed meanwhile leaves the entry stale
+    def set(self, key, value, versions):
+        if not replica_caught_up(versions.values()):
+            return
+        self.backend.set(key, (time.time() + self.backend.ttl, versions, value))
+
+    def invalidate(self, tags):
+        for tag in tags:
+            self.backend.bump(tag)
+        self._count('invalidations', len(tags))
+
+    def _page_key(self, args):
+        # pages carrying flashed messages are per-user. Only the query
+        # arguments the view reads are part of the key, so made up ones
+        # cannot fill the cache with copies of a page.
+        if self.backend is None or '_flashes' in session:
+            return None
+        return 'page:{}?{}'.format(request.path, urlencode(
+            [(name, request.args[name]) for name in args if name in request.args]))
+
+    def _store(self, key, rv):
+        if isinstance(rv, str) and not g.get('page_uncacheable'):
+            self.set(key, rv, g.cache_versions)
+
+    def cached(self, *tags, args=()):
+        # Caches the rendered page of a GET view, plain or async, keyed on
+        # its path and the query arguments listed in args. Tags are
+        # formatted with the view arguments and their versions taken before
+        # it runs; the view can add more through add_tags().
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @functools.wraps(view)
+                async def async_wrapper(**kwargs):
+                    key = self._page_key(args)
+                    if key is None:
+                        return await view(**kwargs)
+                    page = self.get(key)
+                    if page is not None:
+                        return page
+                    g.cache_versions = self.versions(tag.format(**kwargs) for tag in tags)
+                    rv = await view(**kwargs)
+                    self._store(key, rv)
+                    return rv
+                return async_wrapper
+
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                key = self._page_key(args)
+                if key is None:
+                    return view(**kwargs)
+                page = self.get(key)
+                if page is not None:
+                    return page
+                g.cache_versions = self.versions(tag.format(**kwargs) for tag in tags)
+                rv = view(**kwargs)
+                self._store(key, rv)
+                return rv
+            return wrapper
+        return decorator
+
+    def add_tags(self, tags):
+        # tags known only once the view has read its rows are versioned then
+        if 'cache_versions' in g:
+            g.cache_versions.update(self.versions(
+                tag for tag in tags if tag not in g.cache_versions))
+
+
+page_cache = PageCache()
+
+
+# Whether what the request read includes the changes behind the given tag
+# versions. Reads from a replica (see replicas.py) only see the changes
+# committed before g.db_replica_synced_at; a page or calendar built from
+# them must not be stored under a version bumped later, or it would stay
+# stale until it expires.
+def replica_caught_up(versions):
+    synced_at = g.get('db_replica_synced_at')
+    return synced_at is None or all(bumped_at(version) <= synced_at for version in versions)
+
+
+# Tags of everything flushed in a transaction are bumped once it commits
+@event.listens_for(Session, 'after_flush')
+def _collect_cache_tags(db_session, flush_context):
+    tags = db_session.info.setdefault('cache_tags', set())
+    for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        tags.update(getattr(obj, 'cache_tags', ()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_cache_tags(db_session):
+    tags = db_session.info.pop('cache_tags', None)
+    if tags and page_cache.backend is not None:
+        page_cache.invalidate(tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cache_tags(db_session):
+    db_session.info.pop('cache_tags', None)
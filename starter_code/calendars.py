@@ -0,0 +1,231 @@
+import bisect
+import calendar
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from cache import page_cache, replica_caught_up
+from models import db, Artist, Show, Venue, SHOW_CARD
+
+
+# ----------------------------------------------------------------------------#
+# Show calendars.
+#
+# A calendar lists the shows of a venue or artist running at some point in a
+# month or week. Most are read with a range scan of the (venue_id,
+# start_time) or (artist_id, start_time) index, see Show.during(). Venues and
+# artists with at least CALENDAR_TREE_MIN_SHOWS shows (years of bookings)
+# get an IntervalTree of all their shows instead, kept for up to
+# CALENDAR_TREE_TTL seconds in a per-process LRU of CALENDAR_TREES entries,
+# so moving from one month to the next does not go back to the database.
+#
+# A tree is dropped as soon as a show, venue or artist in it is committed
+# in this process. Writes from other processes are seen through the page
+# cache version of the owner's tag ('venue:3', bumped by every show of the
+# venue), or when the tree expires.
+# ----------------------------------------------------------------------------#
+class IntervalTree(object):
+    # Static interval tree over items with start_time and end_time. The items
+    # sorted by start form an implicit balanced tree: the node of the slice
+    # [lo, hi) is its middle item, and _max_end holds the latest end in the
+    # slice, so slices that end before a range are skipped whole.
+
+    def __init__(self, items):
+        self._items = sorted(items, key=lambda item: item.start_time)
+        self._starts = [item.start_time for item in self._items]
+        self._max_end = [None] * len(self._items)
+        if self._items:
+            self._build(0, len(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def _build(self, lo, hi):
+        mid = (lo + hi) // 2
+        latest = self._items[mid].end_time
+        if lo < mid:
+            latest = max(latest, self._build(lo, mid))
+        if mid + 1 < hi:
+            latest = max(latest, self._build(mid + 1, hi))
+        self._max_end[mid] = latest
+        return latest
+
+    def overlapping(self, start, end):
+        # items running at some point in [start, end), in start order. Only
+        # the first `limit` items start before end.
+        matches = []
+        self._search(0, len(self._items), start, bisect.bisect_left(self._starts, end), matches)
+        return matches
+
+    def _search(self, lo, hi, start, limit, matches):
+        if lo >= hi or lo >= limit:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] <= start:
+            return
+        self._search(lo, mid, start, limit, matches)
+        if mid < limit and self._items[mid].end_time > start:
+            matches.append(self._items[mid])
+        self._search(mid + 1, hi, start, limit, matches)
+
+
+# The owner column and page cache tag of each kind of calendar
+OWNERS = {Venue: (Show.venue_id, 'venue:{}'),
+          Artist: (Show.artist_id, 'artist:{}')}
+
+
+class CalendarTrees(object):
+
+    def __init__(self):
+        self.max_entries = 64
+        self.ttl = 300
+        self.min_shows = 200
+        # (model, id) -> (built at, owner tag version, related keys, tree)
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('CALENDAR_TREES', 64)
+        self.ttl = app.config.get('CALENDAR_TREE_TTL', 300)
+        self.min_shows = app.config.get('CALENDAR_TREE_MIN_SHOWS', 200)
+        self.clear()
+        app.extensions['calendar_trees'] = self
+
+    # SHOW_CARD views of the shows of owner (a venue or artist page view,
+    # with its show counters) running at some point in [start, end)
+    def shows(self, model, owner, start, end):
+        column, _ = OWNERS[model]
+        if self.max_entries and \
+                owner.upcoming_shows_count + owner.past_shows_count >= self.min_shows:
+            return self.tree(model, owner.id).overlapping(start, end)
+        return SHOW_CARD.views(db.session.execute(Show.with_artist_venue(
+            column == owner.id, *Show.during(start, end)).order_by(Show.start_time, Show.id)))
+
+    def tree(self, model, owner_id):
+        key = (model, owner_id)
+        version = self._version(model, owner_id)
+        with self._lock:
+            entry = self._trees.get(key)
+            if entry is not None and time.time() - entry[0] < self.ttl and entry[1] == version:
+                self._trees.move_to_end(key)
+                return entry[3]
+
+        column, _ = OWNERS[model]
+        shows = SHOW_CARD.views(db.session.execute(
+            Show.with_artist_venue(column == owner_id).order_by(Show.start_time, Show.id)))
+        related = {(Venue, show.venue.id) for show in shows} | \
+            {(Artist, show.artist.id) for show in shows}
+        tree = IntervalTree(shows)
+        if not replica_caught_up([version]):
+            return tree
+        with self._lock:
+            self._trees[key] = (time.time(), version, related, tree)
+            self._trees.move_to_end(key)
+            while len(self._trees) > self.max_entries:
+                self._trees.popitem(last=False)
+        return tree
+
+    @staticmethod
+    def _version(model, owner_id):
+        if page_cache.backend is None:
+            return None
+        return page_cache.backend.tag_version(OWNERS[model][1].format(owner_id))
+
+    def discard(self, keys):
+        # drops the trees of the given (model, id) keys, and those listing them
+        with self._lock:
+            for key, entry in list(self._trees.items()):
+                if key in keys or not entry[2].isdisjoint(keys):
+                    del self._trees[key]
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+
+
+calendar_trees = CalendarTrees()
+
+
+# Trees touched by a transaction are dropped once it commits
+@event.listens_for(Session, 'after_flush')
+def _collect_calendar_keys(db_session, flush_context):
+    keys = db_session.info.setdefault('calendar_keys', set())
+    for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        if isinstance(obj, Show):
+            # a show moved to another venue or artist leaves the old one too
+            attrs = inspect(obj).attrs
+            for model, attr in ((Venue, attrs.venue_id), (Artist, attrs.artist_id)):
+                # ids set from a form are still strings
+                keys.update((model, int(owner_id)) for owner_id in
+                            [attr.value] + list(attr.history.deleted) if owner_id is not None)
+        elif isinstance(obj, (Venue, Artist)):
+            keys.add((type(obj), obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _discard_calendar_trees(db_session):
+    keys = db_session.info.pop('calendar_keys', None)
+    if keys:
+        calendar_trees.discard(keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_calendar_keys(db_session):
+    db_session.info.pop('calendar_keys', None)
+
+
+# ----------------------------------------------------------------------------#
+# Calendar ranges.
+# ----------------------------------------------------------------------------#
+VIEWS = ('month', 'week')
+
+# Calendars and range searches keep to these days, so that the weeks around
+# a day, the next month and the look-back of Show.during() stay within what
+# datetime can hold
+FIRST_DAY = datetime.date(1900, 1, 1)
+LAST_DAY = datetime.date(2999, 12, 31)
+
+
+def in_range(*moments):
+    return all(FIRST_DAY <= (moment.date() if isinstance(moment, datetime.datetime) else moment)
+               <= LAST_DAY for moment in moments)
+
+
+# The [start, end) datetimes a month or week calendar covers and the weeks
+# (lists of seven dates, Monday first) it is laid out in. A month shows the
+# whole weeks it touches.
+def calendar_range(view, day):
+    if view == 'week':
+        first = day - datetime.timedelta(days=day.weekday())
+        weeks = [[first + datetime.timedelta(days=i) for i in range(7)]]
+    else:
+        weeks = calendar.Calendar().monthdatescalendar(day.year, day.month)
+    start = datetime.datetime.combine(weeks[0][0], datetime.time())
+    end = datetime.datetime.combine(weeks[-1][-1], datetime.time()) + datetime.timedelta(days=1)
+    return start, end, weeks
+
+
+# The days of the previous and next month or week
+def calendar_steps(view, day):
+    if view == 'week':
+        return day - datetime.timedelta(days=7), day + datetime.timedelta(days=7)
+    first = day.replace(day=1)
+    previous = (first - datetime.timedelta(days=1)).replace(day=1)
+    following = (first + datetime.timedelta(days=32)).replace(day=1)
+    return previous, following
+
+
+# {date: [shows]} of the days of [start, end) each show runs on, in start order
+def shows_by_day(shows, start, end):
+    days = {}
+    for show in shows:
+        day = max(show.start_time, start).date()
+        last = min(show.end_time, end)
+        while datetime.datetime.combine(day, datetime.time()) < last:
+            days.setdefault(day, []).append(show)
+            day += datetime.timedelta(days=1)
+    return days
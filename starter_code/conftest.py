@@ -0,0 +1,21 @@
+import pytest
+
+from app import create_app
+from models import db
+
+
+# An app on an empty SQLite database of its own, with the forms' CSRF
+# checks off and a per-process page cache
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(commands=False, SQLALCHEMY_DATABASE_URI='sqlite:///{}'.format(
+        tmp_path / 'fyyur.db'), WTF_CSRF_ENABLED=False, CACHE_TYPE='memory', TESTING=True)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,75 @@
+# ----------------------------------------------------------------------------#
+# Engine options built from the DB_* settings in config.py.
+#
+# Pool limits only apply to server databases. In PGBOUNCER mode (transaction
+# pooling) a server connection is shared between clients from one
+# transaction to the next, so nothing may be left behind on the session:
+# the driver's prepared statements are turned off and statement_timeout is
+# not sent at connect time (set it on the role instead, or with PgBouncer's
+# query_timeout).
+# ----------------------------------------------------------------------------#
+from sqlalchemy.engine import make_url
+
+
+def backend(uri):
+    # ('postgresql', 'psycopg'), ('sqlite', 'pysqlite'), ... with the driver
+    # SQLAlchemy picks when the URI does not name one
+    url = make_url(uri)
+    return url.get_backend_name(), url.get_dialect().driver
+
+
+def engine_options(config):
+    name, driver = backend(config['SQLALCHEMY_DATABASE_URI'])
+    if name != 'postgresql':
+        return {}
+
+    options = {'pool_size': config['DB_POOL_SIZE'],
+               'max_overflow': config['DB_MAX_OVERFLOW'],
+               'pool_timeout': config['DB_POOL_TIMEOUT'],
+               'pool_recycle': config['DB_POOL_RECYCLE'],
+               'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    pgbouncer = config['PGBOUNCER']
+
+    if driver == 'asyncpg':
+        connect_args = {'timeout': config['DB_CONNECT_TIMEOUT'],
+                        'server_settings': {'application_name': config['DB_APPLICATION_NAME']}}
+        if pgbouncer:
+            connect_args['statement_cache_size'] = 0
+            connect_args['prepared_statement_cache_size'] = 0
+        elif config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['server_settings']['statement_timeout'] = str(
+                config['DB_STATEMENT_TIMEOUT_MS'])
+    else:
+        # libpq based drivers (psycopg, psycopg2)
+        connect_args = {'connect_timeout': config['DB_CONNECT_TIMEOUT'],
+                        'application_name': config['DB_APPLICATION_NAME']}
+        if pgbouncer:
+            if driver == 'psycopg':
+                connect_args['prepare_threshold'] = None
+        elif config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = '-c statement_timeout={}'.format(
+                config['DB_STATEMENT_TIMEOUT_MS'])
+    options['connect_args'] = connect_args
+    return options
+
+
+# The same database through an asyncio driver, for the async read views
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_uri(uri):
+    url = make_url(uri)
+    name = url.get_backend_name()
+    if url.get_dialect().is_async or name not in ASYNC_DRIVERS:
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername='{}+{}'.format(name, ASYNC_DRIVERS[name])).render_as_string(
+        hide_password=False)
+
+
+def replica_binds(config):
+    # {'replica_0': {'url': ..., **engine options}, ...}
+    binds = {}
+    for number, url in enumerate(config.get('DATABASE_REPLICA_URLS', [])):
+        options = engine_options(dict(config, SQLALCHEMY_DATABASE_URI=url))
+        binds['replica_{}'.format(number)] = dict(options, url=url)
+    return binds
@@ -0,0 +1,57 @@
+import functools
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+
+# ----------------------------------------------------------------------------#
+# Show time formatting.
+#
+# Templates get datetime objects, never strings, so nothing is parsed while
+# rendering. Locales, zones and compiled babel patterns are looked up once
+# and reused for every later call; babel itself is only imported then.
+#
+# Show times are stored without a zone, as the wall-clock time they were
+# entered in; localize() attaches that zone so they can be converted for
+# display and written out with an offset.
+# ----------------------------------------------------------------------------#
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+    'time': "h:mma",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_locale(identifier):
+    from babel import Locale
+    return Locale.parse(identifier)
+
+
+@functools.lru_cache(maxsize=None)
+def get_zone(name):
+    return ZoneInfo(name)
+
+
+@functools.lru_cache(maxsize=256)
+def get_pattern(format):
+    from babel.dates import parse_pattern
+    return parse_pattern(PATTERNS.get(format, format))
+
+
+def localize(value, stored_zone='UTC', display_zone=None):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=get_zone(stored_zone))
+    if display_zone is not None and display_zone != stored_zone:
+        value = value.astimezone(get_zone(display_zone))
+    return value
+
+
+def format_datetime(value, format='medium', locale='en_US', stored_zone='UTC',
+                    display_zone=None):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        # only for callers still passing serialized times
+        value = datetime.fromisoformat(value)
+    value = localize(value, stored_zone, display_zone)
+    return get_pattern(format).apply(value, get_locale(locale))
@@ -0,0 +1,86 @@
+# ----------------------------------------------------------------------------#
+# Prints the query plan of every SELECT each route issues.
+#
+# Run it against the same database before and after applying an index
+# migration and diff the two outputs:
+#
+#   $ python explain.py > before.txt
+#   $ flask db upgrade
+#   $ python explain.py > after.txt
+#   $ diff before.txt after.txt
+# ----------------------------------------------------------------------------#
+import argparse
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, Artist, Genre, Venue
+from slowlog import explain
+
+ROUTES = [
+    ('GET', '/venues', None),
+    ('GET', '/venues/{venue_id}', None),
+    ('GET', '/artists', None),
+    ('GET', '/artists?letter=A', None),
+    ('GET', '/artists/{artist_id}', None),
+    ('GET', '/shows', None),
+    ('GET', '/shows?when=upcoming', None),
+    ('GET', '/shows?when=past', None),
+    ('GET', '/shows/whats-on', None),
+    ('GET', '/venues/{venue_id}/calendar', None),
+    ('GET', '/artists/{artist_id}/calendar?view=week', None),
+    ('GET', '/api/availability?venue_id={venue_id}&from=2026-06-01T20:00&to=2026-06-01T23:00',
+     None),
+    ('GET', '/genres/{genre}', None),
+    ('POST', '/venues/search', {'search_term': 'the'}),
+    ('POST', '/artists/search', {'search_term': 'the'}),
+]
+
+
+def sample_arguments():
+    # an existing id of each kind, so detail routes hit real rows
+    venue = db.session.query(Venue.id).order_by(Venue.id).first()
+    artist = db.session.query(Artist.id).order_by(Artist.id).first()
+    genre = db.session.query(Genre.name).order_by(Genre.id).first()
+    return {'venue_id': venue[0] if venue else 1,
+            'artist_id': artist[0] if artist else 1,
+            'genre': genre[0] if genre else 'Jazz'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the query plans of every route.')
+    parser.add_argument('--analyze', action='store_true',
+                        help='run the queries (Postgres EXPLAIN ANALYZE)')
+    args = parser.parse_args()
+
+    # plans of cached pages would never be captured
+    app = create_app(commands=False, CACHE_TYPE='null', WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+
+    # every request pushes its own app context, and so gets a fresh session
+    with app.app_context():
+        arguments = sample_arguments()
+        engine = db.engine
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    for method, path, data in ROUTES:
+        path = path.format(**arguments)
+        del statements[:]
+        status = client.open(path, method=method, data=data).status_code
+        print('=' * 78)
+        print('{} {} -> {} ({} statements)'.format(method, path, status, len(statements)))
+        with engine.connect() as connection:
+            for statement, parameters in statements:
+                print('-' * 78)
+                print(statement.strip())
+                for line in explain(connection, statement, parameters, args.analyze):
+                    print('    ' + line)
+    event.remove(engine, 'before_cursor_execute', capture)
+
+if __name__ == '__main__':
+    main()
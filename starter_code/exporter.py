@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, Artist, Genre, Show, Venue, artist_genres, venue_genres
+
+
+# ----------------------------------------------------------------------------#
+# Streaming export of venues, artists and shows as JSONL or CSV.
+#
+# Rows are read from a server-side cursor a batch at a time and encoded
+# straight into output chunks, so memory stays flat whatever the table size.
+# The genres of each batch are fetched with one extra query.
+# ----------------------------------------------------------------------------#
+EXPORTS = {'venues': (Venue, venue_genres),
+           'artists': (Artist, artist_genres),
+           'shows': (Show, None)}
+
+BATCH_SIZE = 1000
+
+
+def _batches(kind, since):
+    model, association = EXPORTS[kind]
+    table = model.__table__
+    query = db.select(*table.c).order_by(table.c.id)
+    if since is not None:
+        query = query.where(table.c.updated_at >= since)
+    result = db.session.execute(query.execution_options(yield_per=BATCH_SIZE))
+    for rows in result.partitions():
+        batch = [dict(row._mapping) for row in rows]
+        if association is not None:
+            key = association.c['{}_id'.format(model.__tablename__.lower())]
+            genres = {}
+            for row_id, name in db.session.execute(
+                    db.select(key, Genre.name).join(Genre, Genre.id == association.c.genre_id).where(
+                        key.in_([row['id'] for row in batch])).order_by(key, Genre.name)):
+                genres.setdefault(row_id, []).append(name)
+            for row in batch:
+                row['genres'] = genres.get(row['id'], [])
+        yield batch
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def export_chunks(kind, file_format='jsonl', since=None, compress=False):
+    # Yields the encoded export a batch at a time, gzipped when compress is set
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    if file_format == 'csv':
+        model, association = EXPORTS[kind]
+        header = [column.name for column in model.__table__.c]
+        if association is not None:
+            header.append('genres')
+        chunk = (','.join(header) + '\r\n').encode('utf-8')
+        yield gzip.compress(chunk) if gzip else chunk
+    for batch in _batches(kind, since):
+        if file_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                if 'genres' in row:
+                    row['genres'] = ','.join(row['genres'])
+                writer.writerow([_default(row[column]) if isinstance(row[column], datetime)
+                                 else row[column] for column in header])
+            chunk = buffer.getvalue().encode('utf-8')
+        else:
+            chunk = ''.join(json.dumps(row, default=_default) + '\n'
+                            for row in batch).encode('utf-8')
+        yield gzip.compress(chunk) if gzip else chunk
+    if gzip:
+        yield gzip.flush()
+
+
+def parse_since(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']), default='jsonl',
+              show_default=True)
+@click.option('--since', help='Only rows changed at or after this ISO timestamp.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help='Output file, stdout by default.')
+@with_appcontext
+def export_command(kind, file_format, since, compress, output):
+    """Stream venues, artists or shows out as JSONL or CSV."""
+    try:
+        since = parse_since(since)
+    except ValueError:
+        raise click.BadParameter('not an ISO timestamp', param_hint='--since')
+    out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for chunk in export_chunks(kind, file_format, since, compress):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
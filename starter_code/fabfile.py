@@ -1,3 +1,5 @@
+import os
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -5,10 +7,13 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # fails when a route issues more statements or got slower than in the
+    # committed baseline (refresh it with: python -m benchmark -o benchmark/baseline.json)
+    command = "python -m benchmark --reseed --output benchmark/latest.json"
+    if os.path.exists("benchmark/baseline.json"):
+        command += " --compare benchmark/baseline.json"
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local(command, capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, ValidationError
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -13,8 +13,20 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        default=datetime.today
     )
+    # left empty, the show lasts DEFAULT_SHOW_LENGTH
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate_end_time(self, field):
+        from models import show_end
+        try:
+            show_end(self.start_time.data, field.data)
+        except ValueError as e:
+            raise ValidationError(str(e))
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,34 @@
+# ----------------------------------------------------------------------------#
+# gunicorn settings:
+#
+#   $ gunicorn -c gunicorn.conf.py wsgi:app
+#   $ gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi:app
+#
+# The app is loaded and warmed up once in the master process and the workers
+# are forked from it, so they start ready to serve and share its memory.
+# ----------------------------------------------------------------------------#
+import multiprocessing
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+# a per-process page cache would only be invalidated in the worker that
+# made a change (see CACHE_TYPE in config.py)
+if workers > 1:
+    os.environ.setdefault('CACHE_TYPE', 'file')
+
+
+def when_ready(server):
+    # with preload_app wsgi.py (or asgi.py) has already been imported in the
+    # master
+    from app import preload
+    app = server.app.wsgi()
+    preload(getattr(app, 'flask_app', app))
+
+
+def child_exit(server, worker):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,270 @@
+import bisect
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+
+from cache import page_cache
+from forms import ArtistForm, ShowForm, VenueForm
+from models import db, Artist, Genre, Show, Venue, apply_show_counters, \
+    artist_genres, artist_names, show_counters, show_end, venue_genres, venue_names
+
+
+# ----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows from CSV or JSONL files.
+#
+# Rows are validated with the same forms the create pages use, then written
+# a chunk at a time: one executemany INSERT (or COPY for shows on Postgres)
+# per table and one transaction per chunk. After each commit the number of
+# source rows consumed is saved to <file>.checkpoint, and --resume skips
+# them on the next run.
+# ----------------------------------------------------------------------------#
+FORMS = {'venues': VenueForm, 'artists': ArtistForm, 'shows': ShowForm}
+ENTITIES = {'venues': (Venue, venue_genres, venue_names),
+            'artists': (Artist, artist_genres, artist_names)}
+
+
+def read_rows(path, file_format):
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def form_data(row):
+    # genres may come as a list (JSONL) or a comma separated string (CSV)
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(',') if genre.strip()]
+        if isinstance(value, list):
+            for item in value:
+                data.add(key, item)
+        elif value is not None:
+            data.add(key, str(value))
+    return data
+
+
+def validate(kind, row):
+    form = FORMS[kind](formdata=form_data(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    if kind == 'shows':
+        # the form fills in a missing start time with its default (now),
+        # which must not end up as the date of an imported show
+        if not str(row.get('start_time') or '').strip():
+            return None, {'start_time': ['This field is required.']}
+        try:
+            return {'venue_id': int(form.venue_id.data),
+                    'artist_id': int(form.artist_id.data),
+                    'start_time': form.start_time.data,
+                    'end_time': form.end_time.data}, None
+        except (TypeError, ValueError):
+            return None, {'id': ['artist_id and venue_id must be integers']}
+    record = {'name': form.name.data,
+              'city': form.city.data,
+              'state': form.state.data,
+              'phone': form.phone.data,
+              'image_link': form.image_link.data,
+              'facebook_link': form.facebook_link.data,
+              'genres': form.genres.data}
+    if kind == 'venues':
+        record['address'] = form.address.data
+    return record, None
+
+
+def insert_entities(model, association, records):
+    genres = Genre.get_or_create([name for record in records for name in record['genres']])
+    db.session.flush()
+    genre_ids = {genre.name: genre.id for genre in genres}
+
+    table = model.__table__
+    rows = [{key: value for key, value in record.items() if key != 'genres'}
+            for record in records]
+    ids = [row_id for row_id, in db.session.execute(
+        table.insert().returning(table.c.id, sort_by_parameter_order=True), rows)]
+
+    key = '{}_id'.format(model.__tablename__.lower())
+    links = [{key: row_id, 'genre_id': genre_ids[name]}
+             for row_id, record in zip(ids, records) for name in dict.fromkeys(record['genres'])]
+    if links:
+        db.session.execute(association.insert(), links)
+    return ids
+
+
+# Splits records into those that fit and those that overlap a show of their
+# venue or artist, booked already or earlier in the list. The bookings of
+# each venue and artist never overlap, so they are kept as lists sorted by
+# start and a record only needs checking against its two neighbours.
+def unbooked(records):
+    if not records:
+        return [], []
+    start = min(record['start_time'] for record in records)
+    end = max(record['end_time'] for record in records)
+    bookings = {}
+    for row in db.session.execute(db.select(
+            Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).filter(
+            db.or_(Show.venue_id.in_(set(record['venue_id'] for record in records)),
+                   Show.artist_id.in_(set(record['artist_id'] for record in records))),
+            *Show.during(start, end))):
+        for key in ((Venue, row.venue_id), (Artist, row.artist_id)):
+            bisect.insort(bookings.setdefault(key, []), (row.start_time, row.end_time))
+
+    fits, clashes = [], []
+    for record in records:
+        keys = ((Venue, record['venue_id']), (Artist, record['artist_id']))
+        interval = (record['start_time'], record['end_time'])
+        if any(_overlaps(bookings.get(key, []), interval) for key in keys):
+            clashes.append(record)
+            continue
+        for key in keys:
+            bisect.insort(bookings.setdefault(key, []), interval)
+        fits.append(record)
+    return fits, clashes
+
+
+def _overlaps(intervals, interval):
+    i = bisect.bisect_left(intervals, interval)
+    return (i < len(intervals) and intervals[i][0] < interval[1]) or \
+        (i > 0 and intervals[i - 1][1] > interval[0])
+
+
+def insert_shows(records):
+    # drop rows pointing at venues or artists that do not exist, in one
+    # lookup per table for the whole chunk, and rows that would double-book
+    # one (see Show.bookings)
+    venue_ids = set(row_id for row_id, in db.session.query(Venue.id).filter(
+        Venue.id.in_(set(record['venue_id'] for record in records))))
+    artist_ids = set(row_id for row_id, in db.session.query(Artist.id).filter(
+        Artist.id.in_(set(record['artist_id'] for record in records))))
+    known = [record['venue_id'] in venue_ids and record['artist_id'] in artist_ids
+             for record in records]
+    rejected = [(record, 'unknown artist_id or venue_id')
+                for record, ok in zip(records, known) if not ok]
+    records = [record for record, ok in zip(records, known) if ok]
+    for record in records:
+        record['end_time'] = show_end(record['start_time'], record.get('end_time'))
+    records, clashes = unbooked(records)
+    rejected.extend((record, 'venue or artist already booked at that time')
+                    for record in clashes)
+
+    now = datetime.now()
+    deltas = {}
+    for record in records:
+        record['counted_past'] = record['start_time'] <= now
+        for counter in show_counters(record['venue_id'], record['artist_id'],
+                                     record['start_time'], record['counted_past']):
+            deltas[counter] = deltas.get(counter, 0) + 1
+
+    connection = db.session.connection()
+    cursor = connection.connection.cursor()
+    columns = ('venue_id', 'artist_id', 'start_time', 'end_time', 'counted_past')
+    if connection.dialect.name == 'postgresql' and hasattr(cursor, 'copy_expert'):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([record[column] for column in columns])
+        buffer.seek(0)
+        cursor.copy_expert('COPY "Show" ({}) FROM STDIN WITH CSV'.format(
+            ', '.join(columns)), buffer)
+    elif records:
+        db.session.execute(Show.__table__.insert(),
+                           [{column: record[column] for column in columns} for record in records])
+    apply_show_counters(connection, deltas)
+    return records, rejected
+
+
+def import_file(kind, path, file_format, chunk_size, resume, rejects):
+    checkpoint_path = path + '.checkpoint'
+    skip = 0
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            skip = json.load(f)['rows']
+
+    started = time.time()
+    consumed, imported, failed = skip, 0, 0
+    chunk = []
+
+    def flush_chunk():
+        nonlocal imported, failed
+        tags, names, names_index = set(), [], None
+        if kind == 'shows':
+            inserted, refused = insert_shows(chunk) if chunk else ([], [])
+            for record, error in refused:
+                rejects.write(json.dumps({'row': record, 'errors': {
+                    'id': [error]}}, default=str) + '\n')
+            failed += len(refused)
+            for record in inserted:
+                tags.update(['venues', 'shows'])
+                tags.update(['venue:{}'.format(record['venue_id']),
+                             'artist:{}'.format(record['artist_id'])])
+        elif chunk:
+            model, association, names_index = ENTITIES[kind]
+            inserted = insert_entities(model, association, chunk)
+            names = [(row_id, record['name']) for row_id, record in zip(inserted, chunk)]
+            tags.update([kind, 'shows'])
+        else:
+            inserted = []
+        db.session.commit()
+        imported += len(inserted)
+
+        # what the ORM hooks would have done for row-by-row inserts
+        for row_id, name in names:
+            names_index.add(row_id, name)
+        if tags and page_cache.backend is not None:
+            page_cache.invalidate(tags)
+
+        with open(checkpoint_path, 'w') as f:
+            json.dump({'rows': consumed}, f)
+        elapsed = time.time() - started
+        click.echo('{} rows read, {} imported, {} rejected, {:.0f} rows/s'.format(
+            consumed, imported, failed, (consumed - skip) / elapsed if elapsed else 0))
+
+    for number, row in enumerate(read_rows(path, file_format)):
+        if number < skip:
+            continue
+        consumed = number + 1
+        record, errors = validate(kind, row)
+        if errors:
+            failed += 1
+            rejects.write(json.dumps({'line': number + 1, 'row': row, 'errors': errors}) + '\n')
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush_chunk()
+            chunk = []
+    if chunk or consumed > skip:
+        flush_chunk()
+    return imported, failed, time.time() - started
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(FORMS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True,
+              help='Rows written per transaction.')
+@click.option('--resume', is_flag=True, help='Skip the rows a previous run committed.')
+@with_appcontext
+def import_command(kind, path, file_format, chunk_size, resume):
+    """Bulk import venues, artists or shows from a CSV or JSONL file."""
+    if file_format is None:
+        file_format = 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+    # the forms need a request context to validate in
+    with current_app.test_request_context(), open(path + '.rejects.jsonl', 'a') as rejects:
+        imported, failed, elapsed = import_file(kind, path, file_format, chunk_size, resume, rejects)
+    click.echo('Imported {} {} in {:.1f}s ({:.0f} rows/s), {} rejected{}'.format(
+        imported, kind, elapsed, imported / elapsed if elapsed else 0, failed,
+        ' (see {}.rejects.jsonl)'.format(path) if failed else ''))
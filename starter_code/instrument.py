@@ -0,0 +1,119 @@
+import time
+from html import escape
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ----------------------------------------------------------------------------#
+# Per-request SQL instrumentation.
+#
+# Every statement run while a request is being handled is counted and timed
+# through engine events. The totals go out as a Server-Timing header, as an
+# HTML panel at the bottom of pages when SQL_DEBUG_PANEL is set, and are
+# checked against the QUERY_BUDGETS of the endpoint.
+#
+# Statements issued while a streamed response is being sent happen after the
+# headers are out and are not included.
+# ----------------------------------------------------------------------------#
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestQueries(object):
+
+    def __init__(self, keep_statements=False):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, None)
+        # (seconds, statement) of every query, only kept for the debug panel
+        self.statements = [] if keep_statements else None
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        if elapsed > self.slowest[0]:
+            self.slowest = (elapsed, statement)
+        if self.statements is not None:
+            self.statements.append((elapsed, statement))
+
+
+def current_queries():
+    if has_app_context():
+        return g.get('sql_queries')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    queries = current_queries()
+    if queries is not None:
+        queries.record(statement, elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_timer(context):
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+PANEL = '''<div id="sql-debug" style="font:12px monospace;background:#fff;color:#222;
+border-top:2px solid #c33;padding:8px;position:relative;z-index:10000">
+<strong>{count} queries in {duration:.1f} ms</strong> ({endpoint}, budget {budget})
+<ol>{rows}</ol></div>'''
+
+
+def _panel(queries, endpoint, budget):
+    rows = ''.join('<li><b>{:.2f} ms</b> <code>{}</code></li>'.format(
+        elapsed * 1000, escape(' '.join(statement.split())))
+        for elapsed, statement in queries.statements)
+    return PANEL.format(count=queries.count, duration=queries.duration * 1000,
+                        endpoint=escape(endpoint or '-'), budget=budget or '-', rows=rows)
+
+
+def init_app(app):
+
+    @app.before_request
+    def start_queries():
+        g.sql_queries = RequestQueries(app.config.get('SQL_DEBUG_PANEL', False))
+
+    @app.after_request
+    def report_queries(response):
+        queries = g.pop('sql_queries', None)
+        if queries is None:
+            return response
+        total = time.perf_counter() - queries.started
+        timings = ['db;dur={:.2f};desc="{} queries"'.format(queries.duration * 1000, queries.count),
+                   'app;dur={:.2f}'.format(total * 1000)]
+        if queries.slowest[1] is not None:
+            timings.insert(1, 'db-slowest;dur={:.2f}'.format(queries.slowest[0] * 1000))
+        response.headers.add('Server-Timing', ', '.join(timings))
+
+        endpoint = request.endpoint
+        budget = app.config.get('QUERY_BUDGETS', {}).get(
+            endpoint, app.config.get('QUERY_BUDGET_DEFAULT'))
+        if budget is not None and queries.count > budget:
+            message = '{} issued {} queries, budget is {} ({})'.format(
+                endpoint, queries.count, budget, request.full_path)
+            if app.config.get('QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+
+        if (queries.statements is not None and response.mimetype == 'text/html'
+                and not response.is_streamed):
+            body = response.get_data(as_text=True)
+            panel = _panel(queries, endpoint, budget)
+            if '</body>' in body:
+                body = body.replace('</body>', panel + '</body>', 1)
+            else:
+                body += panel
+            response.set_data(body)
+        return response
@@ -0,0 +1,140 @@
+import os
+import time
+
+from flask import Response, g, request, template_rendered, before_render_template
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, \
+    Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+from cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Prometheus metrics, served at /metrics.
+#
+# With one process the default registry is enough. Under a pre-forking
+# server set PROMETHEUS_MULTIPROC_DIR to an empty directory before the
+# workers start: each process then writes its samples to its own
+# memory-mapped files there (no cross-process locking) and /metrics adds
+# them up at scrape time.
+# ----------------------------------------------------------------------------#
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram(
+    'fyyur_request_duration_seconds', 'Time spent handling a request',
+    ['route', 'method', 'status'], buckets=BUCKETS)
+IN_PROGRESS = Gauge(
+    'fyyur_requests_in_progress', 'Requests being handled',
+    ['route', 'method'], multiprocess_mode='livesum')
+RENDER_SECONDS = Histogram(
+    'fyyur_template_render_seconds', 'Time spent rendering a template',
+    ['template'], buckets=BUCKETS)
+CACHE_EVENTS = Counter(
+    'fyyur_page_cache_total', 'Page cache lookups (hits, misses, stale) and invalidations',
+    ['result'])
+POOL_WAIT_SECONDS = Histogram(
+    'fyyur_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+POOL_HELD_SECONDS = Histogram(
+    'fyyur_db_connection_held_seconds', 'Time a database connection stayed checked out',
+    buckets=BUCKETS)
+POOL_CHECKED_OUT = Gauge(
+    'fyyur_db_connections_checked_out', 'Database connections currently checked out',
+    multiprocess_mode='livesum')
+
+
+def _route():
+    # the URL rule, not the path, so ids do not create a series each
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _time_pool(engine):
+    # Pool events registered on the engine carry over to the new pool that
+    # engine.dispose() creates (preload() disposes every engine before the
+    # workers fork); the wrapper timing the wait for a connection is put on
+    # each new pool again.
+    _time_connect(engine.pool)
+    dispose = engine.dispose
+
+    def timed_dispose(*args, **kwargs):
+        dispose(*args, **kwargs)
+        _time_connect(engine.pool)
+    engine.dispose = timed_dispose
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.perf_counter()
+        POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop('checked_out_at', None)
+        if started is not None:
+            POOL_HELD_SECONDS.observe(time.perf_counter() - started)
+            POOL_CHECKED_OUT.dec()
+
+
+def _time_connect(pool):
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+    pool.connect = timed_connect
+
+
+def _render_started(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    if g.get('render_started'):
+        RENDER_SECONDS.labels(template.name or 'string').observe(
+            time.perf_counter() - g.render_started.pop())
+
+
+def metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    with app.app_context():
+        from models import db
+        for engine in db.engines.values():
+            _time_pool(engine)
+
+    page_cache.listeners.append(lambda stat, amount: CACHE_EVENTS.labels(stat).inc(amount))
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_labels = (_route(), request.method)
+        IN_PROGRESS.labels(*g.metrics_labels).inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' in g:
+            REQUEST_SECONDS.labels(*g.metrics_labels, response.status_code).observe(
+                time.perf_counter() - g.metrics_started)
+        return response
+
+    @app.teardown_request
+    def end_request_metrics(error):
+        labels = g.pop('metrics_labels', None)
+        if labels is not None:
+            IN_PROGRESS.labels(*labels).dec()
+
+    # module level receivers: blinker only keeps weak references
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,44 @@
+"""query indexes
+
+Revision ID: 3f9d2a6c81e5
+Revises: e41a9c5f7b10
+Create Date: 2026-10-17 15:27:18.046391
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9d2a6c81e5'
+down_revision = 'e41a9c5f7b10'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns), each matching a predicate or ordering the routes use
+INDEXES = [
+    # show_venue / show_artist: shows of one venue or artist by time
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    # shows: keyset pagination on (start_time, id)
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id']),
+    # venues: areas grouped and ordered by city, state, name
+    ('ix_Venue_city_state_name', 'Venue', ['city', 'state', 'name']),
+    # artists and genre pages: keyset pagination on (name, id)
+    ('ix_Venue_name_id', 'Venue', ['name', 'id']),
+    ('ix_Artist_name_id', 'Artist', ['name', 'id']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction, and avoids locking the
+    # tables against writes while the indexes build
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
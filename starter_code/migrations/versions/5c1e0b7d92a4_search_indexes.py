@@ -0,0 +1,44 @@
+"""search indexes
+
+Revision ID: 5c1e0b7d92a4
+Revises: 948e88f6e186
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e0b7d92a4'
+down_revision = '948e88f6e186'
+branch_labels = None
+depends_on = None
+
+# must stay identical to search.PG_DOCUMENT for the planner to use the index
+DOCUMENT = ("to_tsvector('simple', coalesce(name, '') || ' ' || "
+            "coalesce(city, '') || ' ' || coalesce(genres, ''))")
+
+
+def upgrade():
+    # SQLite searches through FTS5 tables made on first use (search.py)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # as in 3f9d2a6c81e5, the indexes build without locking out writes
+    with op.get_context().autocommit_block():
+        for table in ('Venue', 'Artist'):
+            op.execute('CREATE INDEX CONCURRENTLY "ix_{0}_search_document" ON "{0}" '
+                       'USING gin ({1})'.format(table, DOCUMENT))
+            op.execute('CREATE INDEX CONCURRENTLY "ix_{0}_name_trgm" ON "{0}" '
+                       'USING gin (name gin_trgm_ops)'.format(table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for table in ('Venue', 'Artist'):
+            op.drop_index('ix_{}_name_trgm'.format(table), table_name=table,
+                          postgresql_concurrently=True)
+            op.drop_index('ix_{}_search_document'.format(table), table_name=table,
+                          postgresql_concurrently=True)
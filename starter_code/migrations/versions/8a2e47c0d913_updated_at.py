@@ -0,0 +1,35 @@
+"""updated at
+
+Revision ID: 8a2e47c0d913
+Revises: 3f9d2a6c81e5
+Create Date: 2026-10-17 17:48:26.610254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a2e47c0d913'
+down_revision = '3f9d2a6c81e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    # as in 3f9d2a6c81e5, the indexes build without locking out writes
+    with op.get_context().autocommit_block():
+        for table in ('Venue', 'Artist', 'Show'):
+            op.create_index('ix_{}_updated_at'.format(table), table, ['updated_at'], unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('Show', 'Artist', 'Venue'):
+            op.drop_index('ix_{}_updated_at'.format(table), table_name=table,
+                          postgresql_concurrently=True)
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
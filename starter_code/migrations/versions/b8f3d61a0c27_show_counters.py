@@ -0,0 +1,46 @@
+"""show counters
+
+Revision ID: b8f3d61a0c27
+Revises: 5c1e0b7d92a4
+Create Date: 2026-10-17 11:40:05.524118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f3d61a0c27'
+down_revision = '5c1e0b7d92a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Show', sa.Column('counted_past', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index('ix_Show_upcoming_start_time', 'Show', ['start_time'], unique=False,
+                    postgresql_where=sa.text('NOT counted_past'))
+
+    # backfill from the existing shows. start_time is a local time without
+    # a time zone, as is LOCALTIMESTAMP (now() has one, so the comparison
+    # would go through the session's TimeZone)
+    op.execute('UPDATE "Show" SET counted_past = start_time <= LOCALTIMESTAMP WHERE start_time IS NOT NULL')
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute('''
+            UPDATE "{0}" SET
+                upcoming_shows_count = (SELECT count(*) FROM "Show"
+                    WHERE "Show".{1} = "{0}".id AND start_time IS NOT NULL AND NOT counted_past),
+                past_shows_count = (SELECT count(*) FROM "Show"
+                    WHERE "Show".{1} = "{0}".id AND start_time IS NOT NULL AND counted_past)
+        '''.format(table, key))
+
+
+def downgrade():
+    op.drop_index('ix_Show_upcoming_start_time', table_name='Show')
+    op.drop_column('Show', 'counted_past')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,46 @@
+"""show end time
+
+Revision ID: d4b91e3f6a28
+Revises: 8a2e47c0d913
+Create Date: 2026-10-17 19:12:40.381552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b91e3f6a28'
+down_revision = '8a2e47c0d913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # existing shows last DEFAULT_SHOW_LENGTH (models.py)
+    if op.get_bind().dialect.name == 'postgresql':
+        # Outside the transaction that added the column, so that its lock is
+        # not held while every show is updated. The check is added NOT VALID
+        # (a brief lock) and validated while writes go on, and the index
+        # builds concurrently, as in 3f9d2a6c81e5.
+        with op.get_context().autocommit_block():
+            op.execute('''UPDATE "Show" SET end_time = start_time + interval '3 hours'
+                          WHERE start_time IS NOT NULL''')
+            op.execute('''ALTER TABLE "Show" ADD CONSTRAINT "ck_Show_end_after_start"
+                          CHECK (end_time > start_time) NOT VALID''')
+            op.execute('ALTER TABLE "Show" VALIDATE CONSTRAINT "ck_Show_end_after_start"')
+            op.create_index('ix_Show_during', 'Show', [sa.text('tsrange(start_time, end_time)')],
+                            unique=False, postgresql_using='gist', postgresql_concurrently=True)
+    else:
+        op.execute('''UPDATE "Show" SET end_time = datetime(start_time, '+3 hours')
+                      WHERE start_time IS NOT NULL''')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_Show_during', table_name='Show', postgresql_concurrently=True)
+        op.drop_constraint('ck_Show_end_after_start', 'Show', type_='check')
+    op.drop_column('Show', 'end_time')
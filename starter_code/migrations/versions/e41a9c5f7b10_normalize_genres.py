@@ -0,0 +1,128 @@
+"""normalize genres
+
+Revision ID: e41a9c5f7b10
+Revises: b8f3d61a0c27
+Create Date: 2026-10-17 14:03:52.871630
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a9c5f7b10'
+down_revision = 'b8f3d61a0c27'
+branch_labels = None
+depends_on = None
+
+# must stay identical to search.PG_DOCUMENT for the planner to use the index
+OLD_DOCUMENT = ("to_tsvector('simple', coalesce(name, '') || ' ' || "
+                "coalesce(city, '') || ' ' || coalesce(genres, ''))")
+DOCUMENT = "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(city, ''))"
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table in ('Venue', 'Artist'):
+        key = '{}_id'.format(table.lower())
+        op.create_table('{}_Genre'.format(table),
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(key, 'genre_id')
+        )
+        op.create_index('ix_{}_Genre_genre_id'.format(table), '{}_Genre'.format(table),
+                        ['genre_id', key], unique=False)
+
+    # the edit forms used to join genres with '.', so split on both
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('''
+            INSERT INTO "Genre" (name)
+            SELECT DISTINCT trim(name) FROM (
+                SELECT regexp_split_to_table(genres, '[,.]') AS name FROM "Venue"
+                UNION ALL
+                SELECT regexp_split_to_table(genres, '[,.]') FROM "Artist"
+            ) AS names
+            WHERE trim(name) <> ''
+        ''')
+        for table in ('Venue', 'Artist'):
+            op.execute('''
+                INSERT INTO "{0}_Genre" ({1}, genre_id)
+                SELECT DISTINCT "{0}".id, "Genre".id
+                FROM "{0}", regexp_split_to_table("{0}".genres, '[,.]') AS names(name)
+                JOIN "Genre" ON "Genre".name = trim(names.name)
+            '''.format(table, '{}_id'.format(table.lower())))
+            # genres now match through the association table
+            op.drop_index('ix_{}_search_document'.format(table), table_name=table)
+        for table in ('Venue', 'Artist'):
+            op.drop_column(table, 'genres')
+        # as in 3f9d2a6c81e5, the new indexes build without locking out writes
+        with op.get_context().autocommit_block():
+            for table in ('Venue', 'Artist'):
+                op.execute('CREATE INDEX CONCURRENTLY "ix_{0}_search_document" ON "{0}" '
+                           'USING gin ({1})'.format(table, DOCUMENT))
+    else:
+        # no regexp_split_to_table: split the lists here
+        connection = op.get_bind()
+        genre_ids = {}
+        for table in ('Venue', 'Artist'):
+            rows = connection.execute(sa.text(
+                'SELECT id, genres FROM "{}" WHERE genres IS NOT NULL'.format(table))).all()
+            links = set()
+            for row_id, genres in rows:
+                for name in re.split('[,.]', genres):
+                    name = name.strip()
+                    if not name:
+                        continue
+                    if name not in genre_ids:
+                        genre_ids[name] = connection.execute(sa.text(
+                            'INSERT INTO "Genre" (name) VALUES (:name)'), {'name': name}).lastrowid
+                    links.add((row_id, genre_ids[name]))
+            if links:
+                connection.execute(sa.text(
+                    'INSERT INTO "{0}_Genre" ({1}, genre_id) VALUES (:owner, :genre)'.format(
+                        table, '{}_id'.format(table.lower()))),
+                    [{'owner': owner, 'genre': genre} for owner, genre in sorted(links)])
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column('genres')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for table in ('Artist', 'Venue'):
+                op.drop_index('ix_{}_search_document'.format(table), table_name=table,
+                              postgresql_concurrently=True)
+    for table in ('Artist', 'Venue'):
+        op.add_column(table, sa.Column('genres', sa.String(length=120), nullable=True))
+        if op.get_bind().dialect.name == 'postgresql':
+            op.execute('''
+                UPDATE "{0}" SET genres = (
+                    SELECT string_agg("Genre".name, ',' ORDER BY "Genre".name)
+                    FROM "{0}_Genre" JOIN "Genre" ON "Genre".id = "{0}_Genre".genre_id
+                    WHERE "{0}_Genre".{1} = "{0}".id)
+            '''.format(table, '{}_id'.format(table.lower())))
+        else:
+            op.execute('''
+                UPDATE "{0}" SET genres = (
+                    SELECT group_concat(name, ',') FROM (
+                        SELECT "Genre".name AS name
+                        FROM "{0}_Genre" JOIN "Genre" ON "Genre".id = "{0}_Genre".genre_id
+                        WHERE "{0}_Genre".{1} = "{0}".id ORDER BY "Genre".name))
+            '''.format(table, '{}_id'.format(table.lower())))
+        op.drop_index('ix_{}_Genre_genre_id'.format(table), table_name='{}_Genre'.format(table))
+        op.drop_table('{}_Genre'.format(table))
+    op.drop_table('Genre')
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for table in ('Artist', 'Venue'):
+                op.execute('CREATE INDEX CONCURRENTLY "ix_{0}_search_document" ON "{0}" '
+                           'USING gin ({1})'.format(table, OLD_DOCUMENT))
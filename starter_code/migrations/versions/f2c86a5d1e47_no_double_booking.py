@@ -0,0 +1,61 @@
+"""no double booking
+
+Revision ID: f2c86a5d1e47
+Revises: d4b91e3f6a28
+Create Date: 2026-10-17 21:03:18.772904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# the triggers look back as far as the longest show (MAX_SHOW_LENGTH)
+from models import BOOKING_TRIGGERS
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c86a5d1e47'
+down_revision = 'd4b91e3f6a28'
+branch_labels = None
+depends_on = None
+
+OWNERS = ('venue', 'artist')
+
+
+def upgrade():
+    # the constraints cannot be added over existing double bookings: list
+    # them to be moved or deleted first
+    for owner in OWNERS:
+        clashes = op.get_bind().execute(sa.text('''
+            SELECT a.id, b.id FROM "Show" a JOIN "Show" b
+                ON a.{0}_id = b.{0}_id AND a.id < b.id
+                AND a.start_time < b.end_time AND b.start_time < a.end_time
+            LIMIT 10'''.format(owner))).all()
+        if clashes:
+            raise RuntimeError('Shows double-book their {}: {}'.format(
+                owner, ', '.join('{} and {}'.format(*pair) for pair in clashes)))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        # Exclusion constraints can neither be added NOT VALID nor on an
+        # index built concurrently, so the table stays locked while their
+        # indexes build. lock_timeout makes the migration give up (run it
+        # again) rather than queue every query of the app behind it while it
+        # waits for that lock.
+        op.execute("SET LOCAL lock_timeout = '5s'")
+        for owner in OWNERS:
+            op.execute('''ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{0}_overlap"
+                          EXCLUDE USING gist ({0}_id WITH =, tsrange(start_time, end_time) WITH &&)
+                          WHERE (start_time IS NOT NULL)'''.format(owner))
+    elif op.get_bind().dialect.name == 'sqlite':
+        for trigger in BOOKING_TRIGGERS:
+            op.execute(trigger)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for owner in OWNERS:
+            op.drop_constraint('ex_Show_{}_overlap'.format(owner), 'Show')
+    elif op.get_bind().dialect.name == 'sqlite':
+        for owner in OWNERS:
+            for name in ('insert', 'update'):
+                op.execute('DROP TRIGGER "tr_Show_{}_overlap_{}"'.format(owner, name))
@@ -1,10 +1,89 @@
-from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_moment import Moment
+from sqlalchemy import DDL, event, inspect
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.orm import Session
 import datetime
+from typeahead import PrefixIndex
+from replicas import RoutingSession
+from serializers import Shape, View
 
-db = SQLAlchemy()
+# reads may be routed to a replica, see replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Shows listed without an end time last DEFAULT_SHOW_LENGTH. None may last
+# longer than MAX_SHOW_LENGTH: range queries look back that far from the
+# start of a range for shows that are still running.
+DEFAULT_SHOW_LENGTH = datetime.timedelta(hours=3)
+MAX_SHOW_LENGTH = datetime.timedelta(days=7)
+
+
+venue_genres = db.Table(
+    'Venue_Genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_Venue_Genre_genre_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table(
+    'Artist_Genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_Artist_Genre_genre_id', 'genre_id', 'artist_id'))
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return '<Genre %r>' % self.name
+
+    # Returns the Genre rows for names, adding any that do not exist yet to
+    # the session
+    @classmethod
+    def get_or_create(cls, names):
+        names = [name.strip() for name in names if name and name.strip()]
+        existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in existing:
+                existing[name] = cls(name=name)
+                db.session.add(existing[name])
+        return [existing[name] for name in dict.fromkeys(names)]
+
+    @classmethod
+    def find(cls, name):
+        return cls.query.filter(db.func.lower(cls.name) == name.lower()).one_or_none()
+
+    # One page of (id, name, city, state) rows for the venues or artists
+    # tagged with this genre, resolved through the genre_id index of the
+    # association table
+    def members(self, model, state=None, city=None, upcoming=False, page=1, per_page=50):
+        association, key = self.association(model)
+        query = db.session.query(model.id, model.name, model.city, model.state).join(
+            association, key == model.id).filter(association.c.genre_id == self.id)
+        if state:
+            query = query.filter(model.state == state)
+        if city:
+            query = query.filter(model.city == city)
+        if upcoming:
+            query = query.filter(model.upcoming_shows_count > 0)
+        return query.order_by(model.name, model.id).limit(per_page).offset(
+            (page - 1) * per_page).all()
+
+
+    # The association table between model and Genre, and its model id column
+    @staticmethod
+    def association(model):
+        association = model.genres.property.secondary
+        return association, association.c[model.__tablename__.lower() + '_id']
+
+    # Names of the genres of one venue or artist
+    @classmethod
+    def names_query(cls, model, owner_id):
+        association, key = cls.association(model)
+        return db.select(cls.name).join(association, association.c.genre_id == cls.id).filter(
+            key == owner_id).order_by(cls.name)
 
 
 class Venue(db.Model):
@@ -12,7 +91,8 @@ class Venue(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, lazy='selectin',
+                             order_by='Genre.name')
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
@@ -22,93 +102,87 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120), nullable=True)
     seeking_talent = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(120))
+    # show counters kept up to date by the Show flush hooks below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # last time the row changed, for incremental exports
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.datetime.now,
+                           onupdate=datetime.datetime.now, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_Venue_city_state_name', 'city', 'state', 'name'),
+        db.Index('ix_Venue_name_id', 'name', 'id'),
+    )
 
     def add(self):
         db.session.add(self)
         db.session.commit()
+        venue_names.add(self.id, self.name)
 
     def update(self):
         # db.session.update(self)
         db.session.commit()
+        venue_names.add(self.id, self.name)
 
     def delete(self):
+        venue_id = self.id
         db.session.delete(self)
         db.session.commit()
+        venue_names.discard(venue_id)
 
     # How does this work? Why is it needed?
     def __repr__(self):
         return '<Venue %r>' % self
 
-    # comment until figure out why
+    # Rendered pages to drop from the page cache when this venue changes
     @property
-    def serialize(self):
-        return {'id': self.id,
-                'name': self.name,
-                'genres': self.genres,
-                'city': self.city,
-                'state': self.state,
-                'phone': self.phone,
-                'address': self.address,
-                'image_link': self.image_link,
-                'facebook_link': self.facebook_link,
-                'website': self.website_link,
-                'seeking_talent': self.seeking_talent,
-                'seeking_description': self.seeking_description
-                }
+    def cache_tags(self):
+        return ['venue:{}'.format(self.id), 'venues', 'shows']
 
-    @property
-    def serialize_with_upcoming_shows_count(self):
-        return {'id': self.id,
-                'name': self.name,
-                'city': self.city,
-                'state': self.state,
-                'phone': self.phone,
-                'address': self.address,
-                'image_link': self.image_link,
-                'facebook_link': self.facebook_link,
-                'website_link': self.website_link,
-                'seeking_talent': self.seeking_talent,
-                'seeking_description': self.seeking_description,
-                'num_shows': Show.query.filter(
-                    Show.start_time > datetime.datetime.now(),
-                    Show.venue_id == self.id)
-                }
+    # The venue page's view of a venue (see VENUE_PAGE), or None. The
+    # shows are left out for the edit form.
+    @classmethod
+    def details(cls, venue_id, shows=True):
+        venue = VENUE_PAGE.first(db.session.execute(
+            VENUE_PAGE.select().filter(cls.id == venue_id)).all())
+        if venue is not None:
+            venue.genres = db.session.scalars(Genre.names_query(cls, venue_id)).all()
+            if shows:
+                venue.upcoming_shows, venue.past_shows = Show.upcoming_and_past(
+                    Show.venue_id == venue_id)
+        return venue
 
-    @property
-    def serialize_with_shows_details(self):
-        return {'id': self.id,
-                'name': self.name,
-                'city': self.city,
-                'state': self.state,
-                'phone': self.phone,
-                'address': self.address,
-                'genres': self.genres,
-                'image_link': self.image_link,
-                'facebook_link': self.facebook_link,
-                'seeking_talent': self.seeking_talent,
-                'seeking_description': self.seeking_description,
-                'website': self.website_link,
-                'upcoming_shows': [show.serialize_with_artist_venue for show in Show.query.filter(
-                    Show.start_time > datetime.datetime.now(),
-                    Show.venue_id == self.id).all()],
-                'past_shows': [show.serialize_with_artist_venue for show in Show.query.filter(
-                    Show.start_time < datetime.datetime.now(),
-                    Show.venue_id == self.id).all()],
-                'upcoming_shows_count': len(Show.query.filter(
-                    Show.start_time > datetime.datetime.now(),
-                    Show.venue_id == self.id).all()),
-                'past_shows_count': len(Show.query.filter(
-                    Show.start_time < datetime.datetime.now(),
-                    Show.venue_id == self.id).all())
-                }
-    #
-    @property
-    def filter_on_city_state(self):
-        return {'city': self.city,
-                'state': self.state,
-                'venues': [v.serialize_with_upcoming_shows_count
-                           for v in Venue.query.filter(Venue.city == self.city,
-                                                       Venue.state == self.state).all()]}
+    # Returns one page of city/state areas with their venues and upcoming
+    # show counts, built from a single query. The page holds per_page
+    # areas; has_next tells whether another page follows.
+    @classmethod
+    def areas(cls, page=1, per_page=20):
+        return cls.group_areas(db.session.execute(cls.areas_query(page, per_page)), per_page)
+
+    # The venues of one page of areas (plus the first venue rows of the next
+    # area, if any), ordered by area
+    @classmethod
+    def areas_query(cls, page=1, per_page=20):
+        area_page = db.select(cls.city, cls.state).distinct().order_by(
+            cls.city, cls.state).limit(per_page + 1).offset(
+            (page - 1) * per_page).subquery()
+        return db.select(
+            cls.id, cls.name, cls.city, cls.state,
+            cls.upcoming_shows_count.label('num_shows')).join(
+            area_page, db.and_(cls.city == area_page.c.city,
+                               cls.state == area_page.c.state)).order_by(
+            cls.city, cls.state, cls.name)
+
+    @staticmethod
+    def group_areas(rows, per_page):
+        areas = []
+        for row in rows:
+            if not areas or (areas[-1]['city'], areas[-1]['state']) != (row.city, row.state):
+                areas.append({'city': row.city, 'state': row.state, 'venues': []})
+            areas[-1]['venues'].append({'id': row.id,
+                                        'name': row.name,
+                                        'num_shows': row.num_shows})
+        return areas[:per_page], len(areas) > per_page
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -121,63 +195,97 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, lazy='selectin',
+                             order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(120))
+    # show counters kept up to date by the Show flush hooks below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # last time the row changed, for incremental exports
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.datetime.now,
+                           onupdate=datetime.datetime.now, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+    )
 
     def add(self):
         db.session.add(self)
         db.session.commit()
+        artist_names.add(self.id, self.name)
 
     def update(self):
         db.session.commit()
+        artist_names.add(self.id, self.name)
 
     def delete(self):
+        artist_id = self.id
         db.session.delete(self)
-        db.session()
+        db.session.commit()
+        artist_names.discard(artist_id)
 
     @property
-    def serialize_with_shows_details(self):
-        return {'id': self.id,
-                'name': self.name,
-                'city': self.city,
-                'state': self.state,
-                'phone': self.phone,
-                'genres': self.genres,
-                'image_link': self.image_link,
-                'facebook_link': self.facebook_link,
-                'seeking_venue': self.seeking_venue,
-                'seeking_description': self.seeking_description,
-                'website_link': self.website_link,
-                'upcoming_shows': [show.serialize_with_artist_venue for show in Show.query.filter(
-                    Show.start_time > datetime.datetime.now(),
-                    Show.artist_id == self.id).all()],
-                'past_shows': [show.serialize_with_artist_venue for show in Show.query.filter(
-                    Show.start_time < datetime.datetime.now(),
-                    Show.artist_id == self.id).all()],
-                'upcoming_shows_count': len(Show.query.filter(
-                    Show.start_time > datetime.datetime.now(),
-                    Show.artist_id == self.id).all()),
-                'past_shows_count': len(Show.query.filter(
-                    Show.start_time < datetime.datetime.now(),
-                    Show.artist_id == self.id).all())
-                }
+    def cache_tags(self):
+        return ['artist:{}'.format(self.id), 'artists', 'shows']
 
-    @property
-    def serialize(self):
-        return {'id': self.id,
-                'name': self.name,
-                'city': self.city,
-                'state': self.state,
-                'phone': self.phone,
-                'genres': self.genres,
-                'image_link': self.image_link,
-                'facebook_link': self.facebook_link,
-                'seeking_venue': self.seeking_venue,
-                }
+    # The artist page's view of an artist (see ARTIST_PAGE), or None. The
+    # shows are left out for the edit form.
+    @classmethod
+    def details(cls, artist_id, shows=True):
+        artist = ARTIST_PAGE.first(db.session.execute(
+            ARTIST_PAGE.select().filter(cls.id == artist_id)).all())
+        if artist is not None:
+            artist.genres = db.session.scalars(Genre.names_query(cls, artist_id)).all()
+            if shows:
+                artist.upcoming_shows, artist.past_shows = Show.upcoming_and_past(
+                    Show.artist_id == artist_id)
+        return artist
+
+    # Alphabetical (name, id) keyset page of the artist index. Only the
+    # id and name columns are loaded, as plain rows rather than entities.
+    @classmethod
+    def index(cls, after=None, letter=None, limit=50):
+        return db.session.execute(cls.index_query(after, letter, limit)).all()
+
+    @classmethod
+    def index_query(cls, after=None, letter=None, limit=50):
+        query = db.select(cls.id, cls.name).filter(cls.name.isnot(None))
+        if letter:
+            upper, lower = letter.upper(), letter.lower()
+            query = query.filter(db.or_(
+                db.and_(cls.name >= upper, cls.name < chr(ord(upper) + 1)),
+                db.and_(cls.name >= lower, cls.name < chr(ord(lower) + 1))))
+        if after is not None:
+            name, artist_id = after
+            query = query.filter(db.or_(
+                cls.name > name,
+                db.and_(cls.name == name, cls.id > artist_id)))
+        return query.order_by(cls.name, cls.id).limit(limit)
+
+    # First letters of artist names with the number of artists under each
+    @classmethod
+    def letter_buckets(cls):
+        return db.session.execute(cls.letter_buckets_query()).all()
+
+    @classmethod
+    def letter_buckets_query(cls):
+        letter = db.func.upper(db.func.substr(cls.name, 1, 1))
+        return db.select(letter.label('letter'),
+                         db.func.count(cls.id).label('count')).filter(
+            cls.name.isnot(None)).group_by(letter).order_by(letter)
+
+    @staticmethod
+    def encode_cursor(name, artist_id):
+        return '{}_{}'.format(name, artist_id)
+
+    @staticmethod
+    def decode_cursor(cursor):
+        name, _, artist_id = cursor.rpartition('_')
+        return name, int(artist_id)
 
 
 class Show(db.Model):
@@ -185,6 +293,8 @@ class Show(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime())
+    # set from start_time and DEFAULT_SHOW_LENGTH when not given, see show_end()
+    end_time = db.Column(db.DateTime())
     venue_id = db.Column(db.Integer, db.ForeignKey(
         'Venue.id'), nullable=False)
     venue = db.relationship(
@@ -193,6 +303,34 @@ class Show(db.Model):
         'Artist.id'), nullable=False)
     artist = db.relationship(
         'Artist', backref=db.backref('shows', cascade='all, delete'))
+    # whether the show is counted in past_shows_count rather than
+    # upcoming_shows_count of its venue and artist
+    counted_past = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # last time the row changed, for incremental exports
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.datetime.now,
+                           onupdate=datetime.datetime.now, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_upcoming_start_time', 'start_time',
+                 postgresql_where=db.text('NOT counted_past'),
+                 sqlite_where=db.text('NOT counted_past')),
+        # overlap (&&) searches of Show.during() on Postgres
+        db.Index('ix_Show_during', db.func.tsrange(start_time, end_time),
+                 postgresql_using='gist').ddl_if(dialect='postgresql'),
+        db.CheckConstraint('end_time > start_time', name='ck_Show_end_after_start'),
+        # no venue or artist is booked twice at the same time (see
+        # BOOKING_TRIGGERS for SQLite). The GiST indexes behind them (with
+        # btree_gist for the ids) also serve Show.bookings().
+        ExcludeConstraint((venue_id, '='), (db.func.tsrange(start_time, end_time), '&&'),
+                          name='ex_Show_venue_overlap', using='gist',
+                          where=db.text('start_time IS NOT NULL')).ddl_if(dialect='postgresql'),
+        ExcludeConstraint((artist_id, '='), (db.func.tsrange(start_time, end_time), '&&'),
+                          name='ex_Show_artist_overlap', using='gist',
+                          where=db.text('start_time IS NOT NULL')).ddl_if(dialect='postgresql'),
+    )
 
     def add(self):
         db.session.add(self)
@@ -210,17 +348,367 @@ class Show(db.Model):
         return '<Show %r>' % self
 
     @property
-    def serialize(self):
-        return {'id': self.id,
-                'start_time': self.start_time.strftime("%m/%d/%Y, %H:%M:%S"),
-                'venue_id': self.venue_id,
-                'artist_id': self.artist_id
-                }
+    def cache_tags(self):
+        return ['venue:{}'.format(self.venue_id), 'artist:{}'.format(self.artist_id),
+                'venues', 'shows']
+
+    # SHOW_CARD rows of the shows with a start time matching criterion,
+    # their artist and venue joined in
+    @classmethod
+    def with_artist_venue(cls, *criterion):
+        return SHOW_CARD.select().join(cls.artist).join(cls.venue).filter(
+            cls.start_time.isnot(None), *criterion)
+
+    # Loads the shows matching criterion together with their artist and venue
+    # in a single joined query and returns (upcoming, past) SHOW_CARD views.
+    @classmethod
+    def upcoming_and_past(cls, *criterion):
+        return cls.split_upcoming_past(SHOW_CARD.views(db.session.execute(
+            cls.with_artist_venue(*criterion).order_by(cls.start_time))))
+
+    # (upcoming, past) of a list of shows
+    @staticmethod
+    def split_upcoming_past(shows):
+        now = datetime.datetime.now()
+        upcoming_shows = [show for show in shows if show.start_time > now]
+        past_shows = [show for show in shows if show.start_time < now]
+        return upcoming_shows, past_shows
+
+    @staticmethod
+    def decode_cursor(cursor):
+        start_time, _, show_id = cursor.rpartition('_')
+        return datetime.datetime.fromisoformat(start_time), int(show_id)
+
+    # Criteria for the shows running at some point in [start, end). Postgres
+    # checks range overlap through the GiST index on tsrange(start_time,
+    # end_time). Elsewhere, and for one venue or artist, where the
+    # (venue_id, start_time) and (artist_id, start_time) indexes are the
+    # better fit, it is a range scan of start_time bounded below by
+    # MAX_SHOW_LENGTH.
+    @classmethod
+    def during(cls, start, end, dialect=None):
+        if dialect == 'postgresql':
+            return [db.func.tsrange(cls.start_time, cls.end_time).op('&&')(
+                db.func.tsrange(start, end))]
+        return [cls.start_time >= start - MAX_SHOW_LENGTH, cls.start_time < end,
+                cls.end_time > start]
+
+    # Shows of a venue and/or an artist running at some point in [start,
+    # end), other than show exclude_id: the bookings a new show there would
+    # clash with. An index lookup on either database, however many shows the
+    # venue or artist has had.
+    @classmethod
+    def bookings(cls, start, end, venue_id=None, artist_id=None, exclude_id=None,
+                 dialect=None, limit=10):
+        owners = []
+        if venue_id is not None:
+            owners.append(cls.venue_id == venue_id)
+        if artist_id is not None:
+            owners.append(cls.artist_id == artist_id)
+        # start_time IS NOT NULL matches the predicate of the exclusion
+        # constraints' partial indexes, so Postgres can use them
+        query = db.select(cls.id, cls.venue_id, cls.artist_id, cls.start_time, cls.end_time).filter(
+            db.or_(*owners), cls.start_time.isnot(None), *cls.during(start, end, dialect))
+        if exclude_id is not None:
+            query = query.filter(cls.id != exclude_id)
+        return query.order_by(cls.start_time).limit(limit)
+
+    # What's on between start and end, optionally in one city: SHOW_CARD
+    # rows in start time order
+    @classmethod
+    def whats_on(cls, start, end, city=None, state=None, limit=100, dialect=None):
+        query = cls.with_artist_venue(*cls.during(start, end, dialect))
+        if city:
+            query = query.filter(Venue.city == city)
+        if state:
+            query = query.filter(Venue.state == state)
+        return query.order_by(cls.start_time, cls.id).limit(limit)
+
+    # Keyset-paginated show listing ordered on (start_time, id). Past shows
+    # are listed most recent first, everything else in chronological order.
+    # Returns the select statement.
+    @classmethod
+    def listing(cls, after=None, when=None, start=None, end=None):
+        query = cls.with_artist_venue()
+        if start is not None:
+            query = query.filter(cls.start_time >= start)
+        if end is not None:
+            query = query.filter(cls.start_time < end)
+        return cls.in_listing_order(query, after, when)
+
+    # query (a select or a Query) filtered on when and ordered and paginated
+    # as listing() does
+    @classmethod
+    def in_listing_order(cls, query, after=None, when=None):
+        now = datetime.datetime.now()
+        if when == 'upcoming':
+            query = query.filter(cls.start_time > now)
+        elif when == 'past':
+            query = query.filter(cls.start_time < now)
+
+        descending = when == 'past'
+        if after is not None:
+            start_time, show_id = after
+            if descending:
+                query = query.filter(db.or_(
+                    cls.start_time < start_time,
+                    db.and_(cls.start_time == start_time, cls.id < show_id)))
+            else:
+                query = query.filter(db.or_(
+                    cls.start_time > start_time,
+                    db.and_(cls.start_time == start_time, cls.id > show_id)))
+        if descending:
+            return query.order_by(cls.start_time.desc(), cls.id.desc())
+        return query.order_by(cls.start_time, cls.id)
+
+    # Moves shows whose start time has passed from the upcoming to the past
+    # counters. Run periodically; returns the number of shows moved.
+    @classmethod
+    def roll_past(cls):
+        now = datetime.datetime.now()
+        due = db.and_(cls.counted_past.is_(False), cls.start_time <= now)
+        deltas = {}
+        for venue_id, artist_id, count in db.session.query(
+                cls.venue_id, cls.artist_id, db.func.count(cls.id)).filter(due).group_by(
+                cls.venue_id, cls.artist_id):
+            for key in ((Venue, venue_id), (Artist, artist_id)):
+                deltas[key] = deltas.get(key, 0) + count
+        for (model, row_id), count in deltas.items():
+            db.session.query(model).filter(model.id == row_id).update({
+                model.upcoming_shows_count: model.upcoming_shows_count - count,
+                model.past_shows_count: model.past_shows_count + count},
+                synchronize_session=False)
+        moved = db.session.query(cls).filter(due).update(
+            {cls.counted_past: True}, synchronize_session=False)
+        if moved:
+            commit_cache_tags(['venues', 'artists', 'shows'] + [
+                '{}:{}'.format(model.__tablename__.lower(), row_id) for model, row_id in deltas])
+        db.session.commit()
+        return moved
+
+    # Recomputes every show classification and counter from scratch, to
+    # repair drift.
+    @classmethod
+    def recount(cls):
+        now = datetime.datetime.now()
+        db.session.query(cls).update(
+            {cls.counted_past: db.and_(cls.start_time.isnot(None), cls.start_time <= now)},
+            synchronize_session=False)
+        for model, key in ((Venue, cls.venue_id), (Artist, cls.artist_id)):
+            counted = db.session.query(db.func.count(cls.id)).filter(
+                key == model.id, cls.start_time.isnot(None))
+            db.session.query(model).update({
+                model.upcoming_shows_count: counted.filter(
+                    cls.counted_past.is_(False)).scalar_subquery(),
+                model.past_shows_count: counted.filter(
+                    cls.counted_past.is_(True)).scalar_subquery()},
+                synchronize_session=False)
+            commit_cache_tags('{}:{}'.format(model.__tablename__.lower(), row_id)
+                              for row_id, in db.session.query(model.id))
+        commit_cache_tags(['venues', 'artists', 'shows'])
+        db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Row shapes of the pages, see serializers.py.
+# ----------------------------------------------------------------------------#
+class ShowCard(View):
+    __slots__ = ()
+
+    # Keyset cursor for the /shows listing: "<start_time iso>_<id>"
+    @property
+    def cursor(self):
+        return '{}_{}'.format(self.start_time.isoformat(), self.id)
+
+
+class Details(View):
+    # filled in after the row by Venue.details() and Artist.details()
+    __slots__ = ('genres', 'upcoming_shows', 'past_shows')
 
     @property
-    def serialize_with_artist_venue(self):
-        return {'id': self.id,
-                'start_time': self.start_time.strftime("%m/%d/%Y, %H:%M:%S"),
-                'venue': [v.serialize for v in Venue.query.filter(Venue.id == self.venue_id).all()][0],
-                'artist': [a.serialize for a in Artist.query.filter(Artist.id == self.artist_id).all()][0]
-                }
+    def upcoming_shows_count(self):
+        return len(self.upcoming_shows)
+
+    @property
+    def past_shows_count(self):
+        return len(self.past_shows)
+
+
+SHOW_CARD = Shape(
+    'ShowCard', ShowCard, id=Show.id, start_time=Show.start_time, end_time=Show.end_time,
+    artist=Shape('ShowArtist', id=Artist.id, name=Artist.name, image_link=Artist.image_link),
+    venue=Shape('ShowVenue', id=Venue.id, name=Venue.name, image_link=Venue.image_link))
+
+VENUE_PAGE = Shape(
+    'VenuePage', Details, id=Venue.id, name=Venue.name, city=Venue.city, state=Venue.state,
+    phone=Venue.phone, address=Venue.address, image_link=Venue.image_link,
+    facebook_link=Venue.facebook_link, seeking_talent=Venue.seeking_talent,
+    seeking_description=Venue.seeking_description, website=Venue.website_link)
+
+ARTIST_PAGE = Shape(
+    'ArtistPage', Details, id=Artist.id, name=Artist.name, city=Artist.city,
+    state=Artist.state, phone=Artist.phone, image_link=Artist.image_link,
+    facebook_link=Artist.facebook_link, seeking_venue=Artist.seeking_venue,
+    seeking_description=Artist.seeking_description, website_link=Artist.website_link)
+
+# The heading of a venue or artist calendar, with the show counters that
+# decide whether it is served from an interval tree (see calendars.py)
+VENUE_CALENDAR = Shape(
+    'VenueCalendar', id=Venue.id, name=Venue.name, city=Venue.city, state=Venue.state,
+    image_link=Venue.image_link, upcoming_shows_count=Venue.upcoming_shows_count,
+    past_shows_count=Venue.past_shows_count)
+
+ARTIST_CALENDAR = Shape(
+    'ArtistCalendar', id=Artist.id, name=Artist.name, city=Artist.city, state=Artist.state,
+    image_link=Artist.image_link, upcoming_shows_count=Artist.upcoming_shows_count,
+    past_shows_count=Artist.past_shows_count)
+
+# Search results and listings only link to the venue or artist
+VENUE_LINK = Shape('VenueLink', id=Venue.id, name=Venue.name)
+ARTIST_LINK = Shape('ArtistLink', id=Artist.id, name=Artist.name)
+
+
+# Name prefix indexes behind /api/typeahead
+venue_names = PrefixIndex(lambda: db.session.query(Venue.id, Venue.name).all())
+artist_names = PrefixIndex(lambda: db.session.query(Artist.id, Artist.name).all())
+
+
+# Bulk UPDATEs skip the flush hooks that collect the cache tags of the rows
+# they change (see cache.py); the tags given here are bumped on commit too.
+def commit_cache_tags(tags):
+    db.session.info.setdefault('cache_tags', set()).update(tags)
+
+
+# The end time a show is stored with: end_time, or DEFAULT_SHOW_LENGTH after
+# it starts. Raises ValueError for a show that ends before it starts or runs
+# longer than MAX_SHOW_LENGTH.
+def show_end(start_time, end_time=None):
+    if start_time is None:
+        return None
+    if end_time is None:
+        return start_time + DEFAULT_SHOW_LENGTH
+    if not start_time < end_time <= start_time + MAX_SHOW_LENGTH:
+        raise ValueError('A show must end after it starts and last at most {}'.format(
+            MAX_SHOW_LENGTH))
+    return end_time
+
+
+# active_history loads the old value before it is replaced, even once a
+# commit has expired the show, so _set_show_end_times() and
+# _collect_show_counters() see where a show moved from
+def _keep_moved_from(show, value, oldvalue, initiator):
+    pass
+
+
+for attribute in (Show.start_time, Show.venue_id, Show.artist_id, Show.counted_past):
+    event.listen(attribute, 'set', _keep_moved_from, active_history=True)
+
+
+@event.listens_for(Session, 'before_flush')
+def _set_show_end_times(db_session, flush_context, instances):
+    for show in list(db_session.new) + list(db_session.dirty):
+        if not isinstance(show, Show):
+            continue
+        attrs = inspect(show).attrs
+        moved_from = attrs.start_time.history.deleted
+        if moved_from and moved_from[0] is not None and show.start_time is not None and \
+                show.end_time is not None and not attrs.end_time.history.has_changes():
+            # a show moved to another time keeps its length
+            show.end_time = show.start_time + (show.end_time - moved_from[0])
+        show.end_time = show_end(show.start_time, show.end_time)
+
+
+# A change to the genres alone only writes the association table, which
+# would leave updated_at, and so the incremental exports, behind
+@event.listens_for(Session, 'before_flush')
+def _touch_genre_owners(db_session, flush_context, instances):
+    for owner in db_session.dirty:
+        if isinstance(owner, (Venue, Artist)) and \
+                inspect(owner).attrs.genres.history.has_changes():
+            owner.updated_at = datetime.datetime.now()
+
+
+# The exclusion constraints need btree_gist for the = on the ids
+event.listen(db.metadata, 'before_create', DDL(
+    'CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+
+# SQLite has no exclusion constraints: triggers refuse a show that overlaps
+# another one of its venue or artist, looking back MAX_SHOW_LENGTH on the
+# (venue_id, start_time) and (artist_id, start_time) indexes
+BOOKING_TRIGGERS = [
+    '''CREATE TRIGGER "tr_Show_{owner}_overlap_{name}" BEFORE {event} ON "Show"
+    WHEN NEW.start_time IS NOT NULL AND EXISTS (
+        SELECT 1 FROM "Show" WHERE {owner}_id = NEW.{owner}_id{other}
+        AND start_time >= datetime(NEW.start_time, '-{days} days')
+        AND start_time < NEW.end_time AND end_time > NEW.start_time)
+    BEGIN SELECT RAISE(ABORT, 'ex_Show_{owner}_overlap: {owner} already booked'); END'''.format(
+        owner=owner, name=event.split()[0].lower(), event=event.format(owner), other=other,
+        days=MAX_SHOW_LENGTH.days)
+    for owner in ('venue', 'artist')
+    for event, other in (('INSERT', ''),
+                         ('UPDATE OF start_time, end_time, {}_id', ' AND id != NEW.id'))]
+
+for trigger in BOOKING_TRIGGERS:
+    event.listen(Show.__table__, 'after_create', DDL(trigger).execute_if(dialect='sqlite'))
+
+
+# ----------------------------------------------------------------------------#
+# Show counters: every flushed show insert, delete or move adjusts the
+# upcoming/past counters of its venue and artist with an in-place UPDATE.
+# ----------------------------------------------------------------------------#
+def show_counters(venue_id, artist_id, start_time, counted_past):
+    if start_time is None:
+        return []
+    column = 'past_shows_count' if counted_past else 'upcoming_shows_count'
+    return [(Venue, venue_id, column), (Artist, artist_id, column)]
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_show_counters(db_session, flush_context, instances):
+    now = datetime.datetime.now()
+    deltas = db_session.info.setdefault('show_counters', {})
+
+    def count(counters, delta):
+        for key in counters:
+            deltas[key] = deltas.get(key, 0) + delta
+
+    for show in db_session.new:
+        if isinstance(show, Show):
+            show.counted_past = show.start_time is not None and show.start_time <= now
+            count(show_counters(show.venue_id, show.artist_id, show.start_time,
+                                show.counted_past), 1)
+    for show in db_session.deleted:
+        if isinstance(show, Show):
+            count(show_counters(show.venue_id, show.artist_id, show.start_time,
+                                show.counted_past), -1)
+    for show in db_session.dirty:
+        if not isinstance(show, Show) or not db_session.is_modified(show):
+            continue
+        attrs = inspect(show).attrs
+        old = [attrs[name].history.deleted[0] if attrs[name].history.deleted
+               else getattr(show, name)
+               for name in ('venue_id', 'artist_id', 'start_time', 'counted_past')]
+        count(show_counters(*old), -1)
+        show.counted_past = show.start_time is not None and show.start_time <= now
+        count(show_counters(show.venue_id, show.artist_id, show.start_time,
+                            show.counted_past), 1)
+
+
+# Applies {(model, id, column): delta} as in-place counter UPDATEs
+def apply_show_counters(connection, deltas):
+    for (model, row_id, column), delta in deltas.items():
+        if delta:
+            table = model.__table__
+            connection.execute(
+                table.update().where(table.c.id == row_id).values(
+                    {column: table.c[column] + delta}))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_show_counters(db_session, flush_context):
+    apply_show_counters(db_session.connection(), db_session.info.pop('show_counters', {}))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_show_counters(db_session):
+    db_session.info.pop('show_counters', None)
@@ -0,0 +1,147 @@
+import itertools
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as BaseSession
+
+
+# ----------------------------------------------------------------------------#
+# Read-replica routing.
+#
+# Replicas are extra binds named replica_0, replica_1, ... (built from
+# DATABASE_REPLICA_URLS). The reads of GET and HEAD requests go to a healthy
+# replica that is less than REPLICA_MAX_LAG seconds behind, taking turns;
+# everything else (writes, other methods, command line jobs) uses the
+# primary. After a request writes, the user's session is pinned to the
+# primary for REPLICA_STICKY_SECONDS so they see their own changes.
+#
+# A lag check tells up to when a replica has replayed the primary's commits
+# (synced_at). Pages and calendars read from it are not cached when one of
+# their tags changed after that, see cache.replica_caught_up().
+# ----------------------------------------------------------------------------#
+LAG_QUERIES = {
+    # 0 when everything received has been replayed: an idle primary sends
+    # nothing, and the last replay timestamp alone would look ever older
+    'postgresql': text(
+        'SELECT CASE WHEN NOT pg_is_in_recovery() '
+        'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'),
+}
+DEFAULT_LAG_QUERY = text('SELECT 0')
+
+
+class Replica(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.healthy = True
+        self.lag = 0.0
+        self.checked_at = None
+        # every commit made before this time had been replayed
+        self.synced_at = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def check(self, engine, interval):
+        # one thread refreshes at a time; the others use the last result
+        if self.checked_at is not None and time.time() - self.checked_at < interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        started = time.time()
+        try:
+            with engine.connect() as connection:
+                query = LAG_QUERIES.get(engine.dialect.name, DEFAULT_LAG_QUERY)
+                self.lag = float(connection.execute(query).scalar() or 0)
+            self.healthy, self.error = True, None
+            self.synced_at = started - self.lag
+        except Exception as e:
+            self.healthy, self.error = False, str(e)
+        finally:
+            self.checked_at = time.time()
+            self._lock.release()
+
+
+class ReplicaRouter(object):
+
+    def __init__(self):
+        self.replicas = []
+        self.max_lag = 5.0
+        self.check_interval = 5.0
+        self.sticky_seconds = 10.0
+        self._turn = itertools.count()
+
+    def init_app(self, app):
+        self.replicas = [Replica(name) for name in sorted(app.config.get('SQLALCHEMY_BINDS', {}))
+                         if name.startswith('replica_')]
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 5.0)
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL', 5.0)
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10.0)
+        app.extensions['replica_router'] = self
+
+        @app.after_request
+        def pin_to_primary(response):
+            if g.get('db_wrote'):
+                session['db_primary_until'] = time.time() + self.sticky_seconds
+            return response
+
+    def reads_from_replica(self):
+        if not self.replicas or not has_request_context():
+            return False
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        return session.get('db_primary_until', 0) < time.time()
+
+    def choose(self, engines):
+        # a usable replica's engine, or None for the primary
+        if 'db_replica' not in g:
+            g.db_replica = None
+            start = next(self._turn)
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(start + offset) % len(self.replicas)]
+                replica.check(engines[replica.name], self.check_interval)
+                if replica.healthy and replica.lag <= self.max_lag:
+                    g.db_replica = replica
+                    # not checked yet (another thread is at it): nothing is
+                    # known to have been replayed
+                    g.db_replica_synced_at = replica.synced_at or 0.0
+                    break
+        return engines[g.db_replica.name] if g.db_replica is not None else None
+
+    def status(self):
+        return [{'name': replica.name, 'healthy': replica.healthy, 'lag': replica.lag,
+                 'checked_at': replica.checked_at, 'synced_at': replica.synced_at,
+                 'error': replica.error}
+                for replica in self.replicas]
+
+
+replica_router = ReplicaRouter()
+
+
+def is_read(clause):
+    if clause is None:
+        return False
+    if getattr(clause, 'is_select', False):
+        return True
+    return getattr(clause, 'is_text', False) and \
+        str(clause).lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not kwargs.get('_flushing') and is_read(clause) and \
+                replica_router.reads_from_replica():
+            engine = replica_router.choose(self._db.engines)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(BaseSession, 'after_flush')
+def _note_write(db_session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
@@ -0,0 +1,214 @@
+from sqlalchemy import text
+from models import db, Artist, Venue, ARTIST_LINK, VENUE_LINK
+
+# ----------------------------------------------------------------------------#
+# Indexed search for venues and artists.
+#
+# Postgres matches name and city against a GIN indexed tsvector and does
+# substring matching on name through a pg_trgm GIN index (both created by the
+# search indexes migration). SQLite, used for local runs, matches through an
+# external-content FTS5 table kept in sync by triggers. Both also match
+# venues and artists tagged with a genre of the same name.
+# ----------------------------------------------------------------------------#
+
+# Past this many matches searches stop counting: the page says "at least"
+COUNT_CAP = 1000
+
+PG_DOCUMENT = "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(city, ''))"
+
+GENRE_MATCH = '''
+    SELECT "{table}_Genre".{key} FROM "{table}_Genre"
+    JOIN "Genre" ON "Genre".id = "{table}_Genre".genre_id
+    WHERE lower("Genre".name) = lower(:term)
+'''
+
+# One lookup per index, unioned: ORed together (with the IN subquery) they
+# would be a sequential scan of the table
+PG_HITS = '''
+    SELECT id FROM "{table}" WHERE {document} @@ plainto_tsquery('simple', :term)
+    UNION
+    SELECT id FROM "{table}" WHERE name ILIKE :pattern
+    UNION
+    {genre_match}
+'''
+
+PG_SEARCH = '''
+    SELECT {columns} FROM ({hits}) AS hits JOIN "{table}" ON "{table}".id = hits.id,
+        plainto_tsquery('simple', :term) AS query
+    ORDER BY ts_rank({document}, query) + similarity(name, :term) DESC, "{table}".id
+    LIMIT :limit OFFSET :offset
+'''
+
+PG_COUNT = '''
+    SELECT count(*) FROM (SELECT id FROM ({hits}) AS hits LIMIT :cap) AS capped
+'''
+
+SQLITE_INDEX = '''
+    CREATE VIRTUAL TABLE {fts} USING fts5(
+        name, city, content='{table}', content_rowid='id',
+        tokenize='trigram')
+'''
+
+SQLITE_TRIGGERS = (
+    '''CREATE TRIGGER {fts}_ai AFTER INSERT ON "{table}" BEGIN
+        INSERT INTO {fts}(rowid, name, city) VALUES (new.id, new.name, new.city);
+    END''',
+    '''CREATE TRIGGER {fts}_ad AFTER DELETE ON "{table}" BEGIN
+        INSERT INTO {fts}({fts}, rowid, name, city)
+        VALUES ('delete', old.id, old.name, old.city);
+    END''',
+    # only when an indexed column changes, not on every counter update
+    '''CREATE TRIGGER {fts}_au AFTER UPDATE OF name, city ON "{table}" BEGIN
+        INSERT INTO {fts}({fts}, rowid, name, city)
+        VALUES ('delete', old.id, old.name, old.city);
+        INSERT INTO {fts}(rowid, name, city) VALUES (new.id, new.name, new.city);
+    END''',
+)
+
+# FTS5 cannot OR a MATCH with other conditions, so genre hits are unioned in
+# and ranked after the text matches
+SQLITE_HITS = '''
+    SELECT rowid AS id, bm25({fts}) AS rank FROM {fts} WHERE {fts} MATCH :query
+    UNION ALL
+    SELECT {key}, 0 FROM ({genre_match})
+'''
+
+SQLITE_SEARCH = '''
+    SELECT {columns} FROM ({hits}) AS hits JOIN "{table}" ON "{table}".id = hits.id
+    GROUP BY "{table}".id
+    ORDER BY min(hits.rank), "{table}".id
+    LIMIT :limit OFFSET :offset
+'''
+
+SQLITE_COUNT = '''
+    SELECT count(*) FROM (SELECT DISTINCT id FROM ({hits}) LIMIT :cap)
+'''
+
+# What a search returns for each model
+RESULTS = {Venue: VENUE_LINK, Artist: ARTIST_LINK}
+
+# Tables whose FTS5 index has been checked in this process
+_sqlite_indexed = set()
+
+
+# Returns (matches, count, estimated) for one page of a ranked search.
+# estimated is set when there are at least count matches, COUNT_CAP or more.
+def search(model, term, page=1, per_page=20):
+    statements = search_statements(db.engine.dialect.name, model, term, page, per_page)
+    if statements is None:
+        return [], 0, False
+    if db.engine.dialect.name == 'sqlite':
+        ensure_sqlite_index(model)
+    matches_query, count_query = statements
+    rows = db.session.execute(matches_query).all()
+    count = db.session.execute(count_query).scalar()
+    return search_page(model, rows, count, page, per_page)
+
+
+# The (matches query, count query) of a search, or None when there is
+# nothing to search for. The two queries do not depend on each other.
+def search_statements(dialect, model, term, page=1, per_page=20):
+    term = term.strip()
+    if not term:
+        return None
+    offset = (page - 1) * per_page
+    if dialect == 'postgresql':
+        return _search_postgres(model, term, per_page, offset)
+    if dialect == 'sqlite' and len(term) >= 3:
+        return _search_sqlite(model, term, per_page, offset)
+    return _search_like(model, term, per_page, offset)
+
+
+# (matches, count, estimated) from the rows of the matches query. A short
+# page ends the results, unless it is empty: the page asked for may be past
+# the end.
+def search_page(model, rows, count, page, per_page):
+    matches = RESULTS[model].views(rows)
+    offset = (page - 1) * per_page
+    if not matches:
+        return matches, count, count >= COUNT_CAP
+    if len(matches) < per_page:
+        return matches, offset + len(matches), False
+    count = max(count, offset + len(matches))
+    return matches, count, count >= COUNT_CAP
+
+
+def _genre_match(model):
+    table = model.__tablename__
+    return GENRE_MATCH.format(table=table, key=_genre_key(model))
+
+
+def _genre_key(model):
+    return '{}_id'.format(model.__tablename__.lower())
+
+
+def _columns(model):
+    # the result columns, for the hand written queries
+    return ', '.join('"{}".{}'.format(model.__tablename__, column.element.name)
+                     for column in RESULTS[model].columns)
+
+
+def _search_postgres(model, term, limit, offset):
+    table = model.__tablename__
+    hits = PG_HITS.format(table=table, document=PG_DOCUMENT, genre_match=_genre_match(model))
+    params = {'term': term, 'pattern': '%{}%'.format(term)}
+    matches = text(PG_SEARCH.format(columns=_columns(model), table=table, hits=hits,
+                                    document=PG_DOCUMENT)).bindparams(
+        limit=limit, offset=offset, **params)
+    count = text(PG_COUNT.format(hits=hits)).bindparams(cap=COUNT_CAP, **params)
+    return matches, count
+
+
+def _search_sqlite(model, term, limit, offset):
+    fts = '{}_search'.format(model.__tablename__.lower())
+    table = model.__tablename__
+    hits = SQLITE_HITS.format(fts=fts, key=_genre_key(model),
+                              genre_match=_genre_match(model))
+    # a quoted phrase makes the trigram tokenizer do substring matching
+    params = {'query': '"{}"'.format(term.replace('"', '""')), 'term': term}
+    matches = text(SQLITE_SEARCH.format(columns=_columns(model), table=table,
+                                        hits=hits)).bindparams(
+        limit=limit, offset=offset, **params)
+    count = text(SQLITE_COUNT.format(hits=hits)).bindparams(cap=COUNT_CAP, **params)
+    return matches, count
+
+
+def _search_like(model, term, limit, offset):
+    # too short for trigrams: fall back to a name prefix match
+    query = RESULTS[model].select().filter(model.name.ilike('{}%'.format(term)))
+    matches = query.order_by(model.name, model.id).limit(limit).offset(offset)
+    count = db.select(db.func.count()).select_from(
+        query.with_only_columns(model.id).limit(COUNT_CAP).subquery())
+    return matches, count
+
+
+# Creates the FTS5 table of model on first use (once per process)
+def ensure_sqlite_index(model):
+    table = model.__tablename__
+    fts = '{}_search'.format(table.lower())
+    if table in _sqlite_indexed:
+        return fts
+    exists = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': fts}).scalar()
+    if not exists:
+        db.session.execute(text(SQLITE_INDEX.format(table=table, fts=fts)))
+        for trigger in SQLITE_TRIGGERS:
+            db.session.execute(text(trigger.format(table=table, fts=fts)))
+        db.session.execute(text(
+            "INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=fts)))
+        db.session.commit()
+    else:
+        # indexes made by an older version keep their triggers otherwise
+        for trigger in SQLITE_TRIGGERS:
+            trigger = trigger.format(table=table, fts=fts)
+            name = trigger.split()[2]
+            current = db.session.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :name"),
+                {'name': name}).scalar()
+            if current != trigger:
+                db.session.execute(text('DROP TRIGGER IF EXISTS {}'.format(name)))
+                db.session.execute(text(trigger))
+        db.session.commit()
+    _sqlite_indexed.add(table)
+    return fts
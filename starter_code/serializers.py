@@ -0,0 +1,79 @@
+from sqlalchemy import select
+
+
+# ----------------------------------------------------------------------------#
+# Row based serializers.
+#
+# A Shape lists the fields a page shows, each a column (or another Shape,
+# for the artist and venue of a show). It is compiled once into a select of
+# just those columns and a __slots__ view class taking them in the same
+# order, so a result row becomes a view in one call: no ORM objects, no
+# attribute instrumentation, no dict per row.
+#
+# Views read like the dicts they replace: venue.name in templates, and
+# venue['name'] or dict(venue) in code.
+# ----------------------------------------------------------------------------#
+class View(object):
+    __slots__ = ()
+    # every field, the base class' extra slots included
+    _fields = ()
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def keys(self):
+        # the fields that hold a value
+        return [field for field in self._fields if hasattr(self, field)]
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, ' '.join(
+            '{}={!r}'.format(field, self[field]) for field in self.keys()))
+
+
+def view_class(name, fields, base=View):
+    # A subclass of base with a slot per field and an __init__ taking the
+    # fields in order, generated once (the way namedtuple does it). Slots of
+    # base are left for the caller to fill in.
+    source = 'def __init__(self, {}):\n{}'.format(
+        ', '.join(fields), '\n'.join('    self.{0} = {0}'.format(field) for field in fields))
+    namespace = {}
+    exec(source, namespace)
+    return type(name, (base,), {'__slots__': tuple(fields),
+                                '__init__': namespace['__init__'],
+                                '_fields': tuple(fields) + base.__slots__})
+
+
+class Shape(object):
+
+    def __init__(self, name, base=View, /, **fields):
+        self.name = name
+        self.view = view_class(name, list(fields), base)
+        self.columns = []
+        arguments = []
+        namespace = {'view': self.view}
+        for field, value in fields.items():
+            start = len(self.columns)
+            if isinstance(value, Shape):
+                # the nested view is built from its slice of the row
+                self.columns.extend(column.label('{}_{}'.format(field, column.name))
+                                    for column in value.columns)
+                namespace[field] = value.convert
+                arguments.append('{}(row[{}:{}])'.format(field, start, len(self.columns)))
+            else:
+                self.columns.append(value.label(field))
+                arguments.append('row[{}]'.format(start))
+        self.convert = eval('lambda row: view({})'.format(', '.join(arguments)), namespace)
+
+    def select(self):
+        return select(*self.columns)
+
+    def views(self, rows):
+        return list(map(self.convert, rows))
+
+    def first(self, rows):
+        for row in rows:
+            return self.convert(row)
+        return None
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import click
+from flask import current_app, has_request_context, request
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ----------------------------------------------------------------------------#
+# Slow-query log.
+#
+# Statements slower than SLOW_QUERY_MS are written as JSON lines to a
+# rotating file with their normalized SQL and fingerprint, parameters, the
+# route and application line that issued them, and a query plan. Plans are
+# captured off the request path: entries wait in a bounded queue for a
+# single background thread, which explains them one at a time on its own
+# connection. `flask slowlog` groups the entries by fingerprint.
+# ----------------------------------------------------------------------------#
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+SKIPPED_FILES = ('slowlog.py', 'instrument.py', 'metrics.py')
+
+
+def normalize(statement):
+    # literals become ?, IN lists and whitespace collapse, so the same query
+    # shape always normalizes to the same text
+    sql = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'%\(\w+\)s|%s|(?<!:):\w+|\$\d+', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', sql)
+    return ' '.join(sql.split())
+
+
+# statements that may write; they are never run again under ANALYZE
+WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+SHARE|'
+                    r'NEXTVAL|SETVAL)\b', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    return hashlib.sha1(sql.encode('utf-8')).hexdigest()[:12]
+
+
+def explain(connection, statement, parameters, analyze):
+    # Query plan lines of a statement; EXPLAIN ANALYZE runs it again, so it
+    # is only used for plain reads
+    if connection.dialect.name == 'postgresql':
+        analyze = analyze and statement.lstrip().upper().startswith('SELECT') and \
+            not WRITES.search(statement)
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def call_site():
+    # innermost application frame outside this kind of plumbing
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(APP_ROOT) and \
+                os.path.basename(frame.filename) not in SKIPPED_FILES:
+            return '{}:{} in {}'.format(os.path.relpath(frame.filename, APP_ROOT),
+                                        frame.lineno, frame.name)
+    return None
+
+
+class SlowQueryLog(object):
+    # entries waiting for a plan; when full, entries are logged without one
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self.threshold = None
+        self.explain = None
+        self.path = None
+        self.logger = logging.getLogger('fyyur.slowlog')
+        self.logger.propagate = False
+        self._queue = queue.Queue(self.QUEUE_SIZE)
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.threshold = app.config.get('SLOW_QUERY_MS')
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', 'plan')
+        self.path = app.config.get('SLOW_QUERY_LOG')
+        if self.threshold is not None and self.path and not self.logger.handlers:
+            handler = RotatingFileHandler(
+                self.path, maxBytes=app.config.get('SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024),
+                backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 5), delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+        app.extensions['slow_query_log'] = self
+
+    def record(self, conn, statement, parameters, elapsed, executemany):
+        sql = normalize(statement)
+        entry = {'time': datetime.now().isoformat(timespec='milliseconds'),
+                 'ms': round(elapsed * 1000, 2),
+                 'fingerprint': fingerprint(sql),
+                 'sql': sql,
+                 'statement': statement,
+                 'parameters': repr(parameters)[:2000],
+                 'endpoint': request.endpoint if has_request_context() else None,
+                 'path': request.full_path if has_request_context() else None,
+                 'call_site': call_site(),
+                 'plan': None}
+        if self.explain and not executemany and \
+                statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            try:
+                self._start_worker()
+                self._queue.put_nowait((conn.engine, statement, parameters, entry))
+                return
+            except queue.Full:
+                entry['plan'] = ['EXPLAIN skipped: too many slow queries waiting']
+        self._write(entry)
+
+    def _write(self, entry):
+        self.logger.info(json.dumps(entry, default=str))
+
+    def _start_worker(self):
+        # threads do not survive a fork: each worker process starts its own
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.QUEUE_SIZE)
+            self._worker = threading.Thread(target=self._explain_queued,
+                                            name='slowlog-explain', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _explain_queued(self):
+        while True:
+            engine, statement, parameters, entry = self._queue.get()
+            try:
+                with engine.connect() as connection:
+                    connection.info['slowlog_explaining'] = True
+                    try:
+                        entry['plan'] = explain(connection, statement, parameters,
+                                                self.explain == 'analyze')
+                    finally:
+                        connection.info.pop('slowlog_explaining', None)
+            except Exception as e:
+                entry['plan'] = ['EXPLAIN failed: {}'.format(e)]
+            self._write(entry)
+            self._queue.task_done()
+
+    def flush(self):
+        # waits for the queued plans to be written
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._queue.join()
+
+
+slow_query_log = SlowQueryLog()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_slow_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.slowlog_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _check_slow(conn, cursor, statement, parameters, context, executemany):
+    threshold = slow_query_log.threshold
+    if threshold is None or context is None or conn.info.get('slowlog_explaining'):
+        return
+    elapsed = time.perf_counter() - context.slowlog_started
+    if elapsed * 1000 >= threshold:
+        slow_query_log.record(conn, statement, parameters, elapsed, executemany)
+
+
+def read_entries(path):
+    # oldest rotated file first
+    paths = [path + '.{}'.format(number) for number in range(99, 0, -1)] + [path]
+    for name in paths:
+        if not os.path.exists(name):
+            continue
+        with open(name) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+@click.command('slowlog')
+@click.option('--since', help='Only entries at or after this ISO timestamp.')
+@click.option('--sort', type=click.Choice(['total', 'count', 'max']), default='total',
+              show_default=True)
+@click.option('--limit', default=20, show_default=True, help='Fingerprints to list.')
+@click.option('--show', 'show_fingerprint', help='Print the slowest entry of a fingerprint.')
+@with_appcontext
+def slowlog_command(since, sort, limit, show_fingerprint):
+    """Summarize the slow-query log by query fingerprint."""
+    path = current_app.config.get('SLOW_QUERY_LOG')
+    if not path:
+        raise click.UsageError('SLOW_QUERY_LOG is not set')
+    groups = {}
+    for entry in read_entries(path):
+        if since and entry['time'] < since:
+            continue
+        group = groups.setdefault(entry['fingerprint'], {
+            'count': 0, 'total': 0.0, 'max': 0.0, 'slowest': None, 'endpoints': set()})
+        group['count'] += 1
+        group['total'] += entry['ms']
+        if entry['ms'] >= group['max']:
+            group['max'], group['slowest'] = entry['ms'], entry
+        if entry.get('endpoint'):
+            group['endpoints'].add(entry['endpoint'])
+
+    if show_fingerprint:
+        group = groups.get(show_fingerprint)
+        if group is None:
+            raise click.BadParameter('no entries', param_hint='--show')
+        entry = group['slowest']
+        click.echo('{} ms at {} ({} {})'.format(entry['ms'], entry['time'], entry['endpoint'],
+                                                entry['path']))
+        click.echo('called from {}'.format(entry['call_site']))
+        click.echo(entry['statement'].strip())
+        click.echo('parameters: {}'.format(entry['parameters']))
+        for line in entry['plan'] or ['(no plan captured)']:
+            click.echo('    ' + line)
+        return
+
+    click.echo('{:<12} {:>6} {:>10} {:>9} {:>9}  {}'.format(
+        'fingerprint', 'count', 'total ms', 'mean ms', 'max ms', 'sql / endpoints'))
+    ranked = sorted(groups.items(), key=lambda item: item[1][sort], reverse=True)
+    for key, group in ranked[:limit]:
+        click.echo('{:<12} {:>6} {:>10.1f} {:>9.1f} {:>9.1f}  {}'.format(
+            key, group['count'], group['total'], group['total'] / group['count'], group['max'],
+            group['slowest']['sql'][:100]))
+        if group['endpoints']:
+            click.echo('{:>52}  {}'.format('', ', '.join(sorted(group['endpoints']))))
@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+
+from exporter import export_chunks
+from models import db, Artist, Genre, Venue
+
+
+def exported(kind, since):
+    return [json.loads(line) for line in
+            b''.join(export_chunks(kind, since=since)).decode('utf-8').splitlines()]
+
+
+def backdate(model):
+    db.session.execute(model.__table__.update().values(updated_at=datetime(2000, 1, 1)))
+    db.session.commit()
+
+
+def test_since_skips_unchanged_rows(app):
+    db.session.add(Venue(name='Hall', city='SF', state='CA', genres=Genre.get_or_create(['Jazz'])))
+    db.session.commit()
+    backdate(Venue)
+
+    assert exported('venues', datetime(2020, 1, 1)) == []
+    assert len(exported('venues', None)) == 1
+
+
+def test_genre_change_is_exported_since(app):
+    for model in (Venue, Artist):
+        db.session.add(model(name='Row', city='SF', state='CA',
+                             genres=Genre.get_or_create(['Jazz'])))
+    db.session.commit()
+    backdate(Venue)
+    backdate(Artist)
+
+    for model, kind in ((Venue, 'venues'), (Artist, 'artists')):
+        row = db.session.query(model).one()
+        row.genres = Genre.get_or_create(['Jazz', 'Rock'])
+        db.session.commit()
+
+        rows = exported(kind, datetime(2020, 1, 1))
+        assert [item['genres'] for item in rows] == [['Jazz', 'Rock']]
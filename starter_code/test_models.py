@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Artist, Show, Venue
+
+
+def add_owners():
+    venue = Venue(name='Hall', city='SF', state='CA')
+    artist = Artist(name='Band', city='SF', state='CA')
+    db.session.add_all([venue, artist])
+    db.session.commit()
+    return venue, artist
+
+
+def counts(*owners):
+    return [(owner.upcoming_shows_count, owner.past_shows_count) for owner in owners]
+
+
+def test_moved_show_keeps_its_length(app):
+    venue, artist = add_owners()
+    start = datetime(2030, 1, 10, 20)
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start,
+                end_time=start + timedelta(hours=2))
+    db.session.add(show)
+    db.session.commit()
+
+    # the commit expired the show, so the old start time is not loaded yet
+    show.start_time = start - timedelta(days=4)
+    db.session.commit()
+
+    assert show.end_time == start - timedelta(days=4) + timedelta(hours=2)
+
+
+def test_show_moved_to_another_venue_moves_its_count(app):
+    venue, artist = add_owners()
+    other = Venue(name='Club', city='SF', state='CA')
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 10, 20))
+    db.session.add_all([other, show])
+    db.session.commit()
+
+    show.venue_id = other.id
+    db.session.commit()
+
+    assert (venue.upcoming_shows_count, other.upcoming_shows_count) == (0, 1)
+    assert artist.upcoming_shows_count == 1
+
+
+def test_counters_follow_shows_through_insert_move_and_delete(app):
+    venue, artist = add_owners()
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 10, 20))
+    db.session.add(show)
+    db.session.commit()
+    assert counts(venue, artist) == [(1, 0), (1, 0)]
+
+    show.start_time = datetime(2000, 1, 10, 20)
+    db.session.commit()
+    assert counts(venue, artist) == [(0, 1), (0, 1)]
+
+    db.session.delete(show)
+    db.session.commit()
+    assert counts(venue, artist) == [(0, 0), (0, 0)]
+
+
+@pytest.mark.parametrize('owner', ['venue', 'artist'])
+def test_double_booking_is_refused(app, owner):
+    venue, artist = add_owners()
+    other = {'venue': Venue, 'artist': Artist}[owner](name='Other', city='SF', state='CA')
+    db.session.add(other)
+    db.session.commit()
+    start = datetime(2030, 1, 10, 20)
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=start))
+    db.session.commit()
+
+    # shares only the venue or only the artist, an hour into the first show
+    ids = {'venue_id': venue.id, 'artist_id': artist.id}
+    ids['artist_id' if owner == 'venue' else 'venue_id'] = other.id
+    db.session.add(Show(start_time=start + timedelta(hours=1), **ids))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+    # back to back is fine
+    db.session.add(Show(start_time=start + timedelta(hours=3), **ids))
+    db.session.commit()
+    shared = venue if owner == 'venue' else artist
+    assert shared.upcoming_shows_count == 2
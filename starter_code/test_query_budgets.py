@@ -0,0 +1,51 @@
+# ----------------------------------------------------------------------------#
+# Query budgets as tests: every budgeted route is requested against a seeded
+# SQLite database with QUERY_BUDGET_RAISE set, so a change that makes a page
+# issue more statements than its QUERY_BUDGETS entry fails here.
+#
+#   $ python -m pytest test_query_budgets.py
+# ----------------------------------------------------------------------------#
+import pytest
+
+from app import create_app
+from benchmark import dataset, runner
+from config import QUERY_BUDGETS
+from models import db
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    database = tmp_path_factory.mktemp('budgets') / 'fyyur.db'
+    # cached pages would issue no statements at all
+    app = create_app(commands=False, SQLALCHEMY_DATABASE_URI='sqlite:///{}'.format(database),
+                     CACHE_TYPE='null', WTF_CSRF_ENABLED=False, QUERY_BUDGET_RAISE=True,
+                     TESTING=True)
+    with app.app_context():
+        db.create_all()
+        dataset.generate(venues=20, artists=40, shows=400)
+    return app
+
+
+@pytest.fixture(scope='module')
+def arguments(app):
+    with app.app_context():
+        return runner.route_arguments()
+
+
+def endpoint(app, method, path):
+    adapter = app.url_map.bind('localhost')
+    return adapter.match(path.split('?')[0], method=method)[0]
+
+
+@pytest.mark.parametrize('method, path, data', runner.ROUTES,
+                         ids=['{} {}'.format(method, path) for method, path, _ in runner.ROUTES])
+def test_route_within_budget(app, arguments, method, path, data):
+    # QueryBudgetExceeded propagates out of the test client under TESTING
+    response = app.test_client().open(path.format(**arguments), method=method, data=data)
+    assert response.status_code == 200
+
+
+def test_every_budget_is_requested(app, arguments):
+    requested = {endpoint(app, method, path.format(**arguments))
+                 for method, path, _ in runner.ROUTES}
+    assert set(QUERY_BUDGETS) <= requested
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from cache import page_cache
+from models import db, Artist, Show, Venue
+
+
+def add_show():
+    venue = Venue(name='Hall', city='SF', state='CA')
+    artist = Artist(name='Band', city='SF', state='CA')
+    db.session.add_all([venue, artist])
+    db.session.commit()
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 10, 20))
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+
+def test_write_invalidates_cached_pages(client):
+    show = add_show()
+    path = '/venues/{}'.format(show.venue_id)
+    assert b'Band' in client.get(path).data
+    hits = page_cache.stats['hits']
+    assert b'Band' in client.get(path).data
+    assert page_cache.stats['hits'] == hits + 1
+
+    # the artist is tagged on the venue page through its show
+    show.artist.name = 'Renamed'
+    db.session.commit()
+    page = client.get(path).data
+    assert b'Renamed' in page and b'Band' not in page
+
+
+def test_double_booking_form_names_the_clash(client):
+    show = add_show()
+    response = client.post('/shows/create', data={
+        'venue_id': show.venue_id, 'artist_id': show.artist_id,
+        'start_time': '2030-01-10 21:00:00'})
+    assert response.status_code == 200
+    assert b'already booked from 2030-01-10 20:00 to 2030-01-10 23:00' in response.data
+    assert Show.query.count() == 1
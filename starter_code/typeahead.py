@@ -0,0 +1,122 @@
+import bisect
+import threading
+import time
+
+
+# ----------------------------------------------------------------------------#
+# In-process prefix index of names to ids, used by /api/typeahead.
+#
+# Entries live in a sorted list of (folded name, id) searched with bisect.
+# The list is built from the database by preload() (or on the first lookup
+# of a process that was not preloaded), updated in place by the model
+# add/update/delete methods, and rebuilt in a background thread once it is
+# max_age seconds old, so that writes made by other worker processes show up
+# eventually. Lookups keep using the old list while it is rebuilt.
+# ----------------------------------------------------------------------------#
+class PrefixIndex(object):
+
+    def __init__(self, load, max_age=300):
+        # load returns (id, name) rows for every entry
+        self._load = load
+        self._max_age = max_age
+        self._app = None
+        self._keys = []
+        self._names = {}
+        self._built_at = None
+        # changes made while a build is loading, replayed on top of it
+        self._pending = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+
+    def init_app(self, app):
+        self._app = app
+
+    @staticmethod
+    def _fold(name):
+        return name.casefold()
+
+    def build(self):
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        with self._lock:
+            self._pending = []
+        try:
+            rows = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        names = {row_id: name for row_id, name in rows if name}
+        keys = sorted((self._fold(name), row_id) for row_id, name in names.items())
+        with self._lock:
+            self._keys, self._names = keys, names
+            for row_id, name in self._pending:
+                self._discard(row_id)
+                if name:
+                    self._add(row_id, name)
+            self._pending = None
+            self._built_at = time.time()
+
+    def _rebuild(self):
+        try:
+            with self._app.app_context():
+                self.build()
+        except Exception:
+            self._app.logger.exception('Could not rebuild the typeahead index')
+        finally:
+            self._rebuilding = False
+
+    def lookup(self, prefix, limit=10):
+        if self._built_at is None:
+            # not preloaded: the first lookup builds it, the others wait
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+        elif self._max_age is not None and time.time() - self._built_at > self._max_age:
+            self._refresh()
+        prefix = self._fold(prefix)
+        with self._lock:
+            keys, names = self._keys, self._names
+            i = bisect.bisect_left(keys, (prefix,))
+            matches = []
+            while i < len(keys) and len(matches) < limit and keys[i][0].startswith(prefix):
+                matches.append({'id': keys[i][1], 'name': names.get(keys[i][1])})
+                i += 1
+        return matches
+
+    def _refresh(self):
+        with self._lock:
+            if self._rebuilding or self._app is None:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='typeahead-rebuild', daemon=True).start()
+
+    def add(self, row_id, name):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((row_id, name))
+            # not built yet: the entry will be picked up by the first build
+            if self._built_at is None:
+                return
+            self._discard(row_id)
+            if name:
+                self._add(row_id, name)
+
+    def discard(self, row_id):
+        self.add(row_id, None)
+
+    # callers hold self._lock
+    def _add(self, row_id, name):
+        bisect.insort(self._keys, (self._fold(name), row_id))
+        self._names[row_id] = name
+
+    def _discard(self, row_id):
+        name = self._names.pop(row_id, None)
+        if name is not None:
+            key = (self._fold(name), row_id)
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
@@ -0,0 +1,589 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, current_app, render_template, request, flash, redirect, \
+    url_for, abort, jsonify, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import NoResultFound
+from models import db, Artist, Genre, Venue, Show, SHOW_CARD, VENUE_CALENDAR, ARTIST_CALENDAR, \
+    artist_names, show_end, venue_names
+from search import search
+from cache import page_cache
+from calendars import VIEWS, calendar_range, calendar_steps, calendar_trees, in_range, \
+    shows_by_day
+from replicas import replica_router
+from exporter import EXPORTS, export_chunks, parse_since
+
+# Forms (and WTForms with them) are imported by the views that use them, so
+# workers that never serve a form do not load them.
+
+
+# Renders a template as an iterator of chunks so long listings can be sent
+# while their rows are still being fetched.
+def stream_template(template_name, **context):
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(5)
+    return stream
+
+# The filters, cursor, time range and page size of a /shows request
+def listing_arguments():
+    filters = {key: request.args[key]
+               for key in ('when', 'from', 'to', 'per_page', 'stream')
+               if request.args.get(key)}
+    try:
+        after = request.args.get('after')
+        after = Show.decode_cursor(after) if after else None
+        start = filters.get('from')
+        start = datetime.fromisoformat(start) if start else None
+        end = filters.get('to')
+        end = datetime.fromisoformat(end) if end else None
+    except ValueError:
+        abort(400)
+    per_page = request.args.get('per_page', current_app.config['SHOWS_PER_PAGE'], type=int)
+    per_page = min(max(per_page, 1), current_app.config['SHOWS_MAX_PER_PAGE'])
+    return filters, after, start, end, per_page
+
+# The view (month or week) and day of a calendar request
+def calendar_arguments():
+    view = request.args.get('view', 'month')
+    try:
+        day = request.args.get('date')
+        day = datetime.strptime(day, '%Y-%m-%d').date() if day else datetime.now().date()
+    except ValueError:
+        abort(400)
+    if view not in VIEWS or not in_range(day):
+        abort(400)
+    return view, day
+
+# Renders the month or week calendar of a venue or artist
+def render_calendar(model, owner, endpoint):
+    if owner is None:
+        abort(404)
+    view, day = calendar_arguments()
+    start, end, weeks = calendar_range(view, day)
+    shows = calendar_trees.shows(model, owner, start, end)
+    page_cache.add_tags(
+        'artist:{}'.format(show.artist.id) if model is Venue else 'venue:{}'.format(show.venue.id)
+        for show in shows)
+    previous, following = calendar_steps(view, day)
+    return render_template('pages/calendar.html', owner=owner, endpoint=endpoint,
+                           kind='venue' if model is Venue else 'artist', view=view, day=day,
+                           weeks=weeks, days=shows_by_day(shows, start, end),
+                           previous=previous, following=following)
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+pages = Blueprint('pages', __name__)
+
+
+@pages.route('/')
+def index():
+    return render_template('pages/home.html')
+
+# ----------------------------------------------------------------------------#
+#  App route for Venues
+# ----------------------------------------------------------------------------#
+@pages.route('/venues')
+@page_cache.cached('venues', args=('page',))
+def venues():
+    page = max(request.args.get('page', 1, type=int), 1)
+    data, has_next = Venue.areas(page, current_app.config['AREAS_PER_PAGE'])
+    return render_template('pages/venues.html', areas=data, page=page, has_next=has_next)
+
+# Search for Venues
+@pages.route('/venues/search', methods=['POST'])
+def search_venues():
+    search_term = request.form.get('search_term', '')
+    page = max(request.form.get('page', 1, type=int), 1)
+    vsearch, count_venues, estimated = search(
+        Venue, search_term, page, current_app.config['SEARCH_PER_PAGE'])
+    response = {
+        "count": count_venues,
+        "estimated": estimated,
+        "data": vsearch
+    }
+
+    return render_template('pages/search_venues.html', results=response, search_term=search_term, page=page)
+
+# Show Venue with Id
+@pages.route('/venues/<int:venue_id>')
+@page_cache.cached('venue:{venue_id}')
+def show_venue(venue_id):
+    venue = Venue.details(venue_id)
+
+    if venue is None:
+        abort(404)
+
+    page_cache.add_tags('artist:{}'.format(show.artist.id)
+                        for show in venue.upcoming_shows + venue.past_shows)
+    return render_template('pages/show_venue.html', venue=venue)
+
+# Venue calendar
+@pages.route('/venues/<int:venue_id>/calendar')
+@page_cache.cached('venue:{venue_id}', args=('view', 'date'))
+def venue_calendar(venue_id):
+    venue = VENUE_CALENDAR.first(db.session.execute(
+        VENUE_CALENDAR.select().filter(Venue.id == venue_id)))
+    return render_calendar(Venue, venue, 'pages.venue_calendar')
+
+# Create new venue GET
+@pages.route('/venues/create', methods=['GET'])
+def create_venue_form():
+    from forms import VenueForm
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+# Create new venue POST
+@pages.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+    from forms import VenueForm
+    venue_form = VenueForm(request.form)
+    try:
+        new_venue = Venue(
+            name=venue_form.name.data,
+            genres=Genre.get_or_create(venue_form.genres.data),
+            city=venue_form.city.data,
+            state=venue_form.state.data,
+            phone=venue_form.phone.data,
+            facebook_link=venue_form.facebook_link.data,
+            image_link=venue_form.image_link.data
+        )
+        new_venue.add()
+        # on successful db insert, flash success
+        flash('Venue ' + request.form['name'] + ' was successfully listed!')
+    except Exception as ex:
+            flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
+            print(ex)
+    return render_template('pages/home.html')
+
+# Edit Venue GET
+@pages.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    from forms import VenueForm
+    venue = Venue.details(venue_id, shows=False)
+    if venue is None:
+        abort(404)
+    form = VenueForm(data=dict(venue))
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+# Edit Venue POST
+@pages.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    from forms import VenueForm
+    form = VenueForm(request.form)
+    try:
+        venue = Venue.query.filter(Venue.id == venue_id).one()
+        venue.name = form.name.data
+        venue.address = form.address.data
+        venue.genres = Genre.get_or_create(form.genres.data)
+        venue.city = form.city.data
+        venue.state = form.state.data
+        venue.phone = form.phone.data
+        venue.facebook_link = form.facebook_link.data
+        venue.image_link = form.image_link.data
+        venue.update()
+        flash('Venue ' + request.form['name'] + ' was successfully updated!')
+    except Exception as e:
+        print(e)
+    return redirect(url_for('pages.show_venue', venue_id=venue_id))
+
+# Delete Venue
+@pages.route('/venues/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+    try:
+        venue_to_delete = Venue.query.filter(Venue.id == venue_id).one()
+        venue_to_delete.delete()
+        flask("Venue {0} has been deleted successfully".format(
+            venue_to_delete[0]['name']))
+    except NoResultFound:
+        abort(404)
+
+    # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
+    # clicking that button delete it from the db then redirect the user to the homepage
+    return None
+
+#  ----------------------------------------------------------------
+#  App Route for Artists
+#  ----------------------------------------------------------------
+# The letter index of /artists counts every artist. It is kept in the page
+# cache under the 'artists' tag, so the pages of every letter and cursor
+# share one count until an artist changes.
+LETTERS_KEY = 'letters:artists'
+
+
+# (letters, None) from the cache, or (None, the tag versions to store them
+# under once counted)
+def cached_letter_buckets():
+    if page_cache.backend is None:
+        return None, None
+    letters = page_cache.get(LETTERS_KEY)
+    return letters, None if letters is not None else page_cache.versions(['artists'])
+
+
+def store_letter_buckets(letters, versions):
+    if versions is not None:
+        page_cache.set(LETTERS_KEY, letters, versions)
+    return letters
+
+
+@pages.route('/artists')
+@page_cache.cached('artists', args=('letter', 'after'))
+def artists():
+    letter = request.args.get('letter', '')[:1]
+    try:
+        after = request.args.get('after')
+        after = Artist.decode_cursor(after) if after else None
+    except ValueError:
+        abort(400)
+    per_page = current_app.config['ARTISTS_PER_PAGE']
+    data = Artist.index(after, letter, per_page)
+    next_cursor = None
+    if len(data) == per_page:
+        next_cursor = Artist.encode_cursor(data[-1].name, data[-1].id)
+    letters, versions = cached_letter_buckets()
+    if letters is None:
+        letters = store_letter_buckets(Artist.letter_buckets(), versions)
+    return render_template('pages/artists.html', artists=data, letter=letter,
+                           letters=letters, next_cursor=next_cursor)
+
+# Search Artist
+@pages.route('/artists/search', methods=['POST'])
+def search_artists():
+    search_term = request.form.get('search_term', '')
+    page = max(request.form.get('page', 1, type=int), 1)
+    asearch, count_artist, estimated = search(
+        Artist, search_term, page, current_app.config['SEARCH_PER_PAGE'])
+    response = {
+        "count": count_artist,
+        "estimated": estimated,
+        "data": asearch
+    }
+    return render_template('pages/search_artists.html', results=response, search_term=search_term, page=page)
+
+# Show Artist homepage
+@pages.route('/artists/<int:artist_id>')
+@page_cache.cached('artist:{artist_id}')
+def show_artist(artist_id):
+    artist = Artist.details(artist_id)
+
+    if artist is None:
+            abort(404)
+
+    page_cache.add_tags('venue:{}'.format(show.venue.id)
+                        for show in artist.upcoming_shows + artist.past_shows)
+    return render_template('pages/show_artist.html', artist=artist)
+
+    # shows the venue page with the given venue_id
+    # TODO: replace with real venue data from the venues table, using venue_id
+    # data1={
+    #   "past_shows": [{
+    #   "venue_id": 1,
+    #   "venue_name": "The Musical Hop",
+    #   "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
+    #   "start_time": "2019-05-21T21:30:00.000Z"
+    # }],
+    # "upcoming_shows": [],
+    # "past_shows_count": 1,
+    # "upcoming_shows_count": 0,
+    # }
+    # data2={
+    # "past_shows": [{
+    #   "venue_id": 3,
+    #   "venue_name": "Park Square Live Music & Coffee",
+    #   "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
+    #   "start_time": "2019-06-15T23:00:00.000Z"
+    # }],
+    # "upcoming_shows": [],
+    # "past_shows_count": 1,
+    # "upcoming_shows_count": 0,
+    # }
+    # data3={
+    # "seeking_venue": False,
+    # "past_shows": [],
+    # "upcoming_shows": [{
+    #   "venue_id": 3,
+    #   "venue_name": "Park Square Live Music & Coffee",
+    #   "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
+    #   "start_time": "2035-04-01T20:00:00.000Z"
+    # }, {
+    #   "venue_id": 3,
+    #   "venue_name": "Park Square Live Music & Coffee",
+    #   "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
+    #   "start_time": "2035-04-08T20:00:00.000Z"
+    # }, {
+    #   "venue_id": 3,
+    #   "venue_name": "Park Square Live Music & Coffee",
+    #   "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
+    #   "start_time": "2035-04-15T20:00:00.000Z"
+    # }],
+    # "past_shows_count": 0,
+    # "upcoming_shows_count": 3,
+    # }
+
+# Artist calendar
+@pages.route('/artists/<int:artist_id>/calendar')
+@page_cache.cached('artist:{artist_id}', args=('view', 'date'))
+def artist_calendar(artist_id):
+    artist = ARTIST_CALENDAR.first(db.session.execute(
+        ARTIST_CALENDAR.select().filter(Artist.id == artist_id)))
+    return render_calendar(Artist, artist, 'pages.artist_calendar')
+
+# Edit Artist GET
+@pages.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    from forms import ArtistForm
+    artist = Artist.details(artist_id, shows=False)
+    if artist is None:
+        abort(404)
+    form = ArtistForm(data=dict(artist))
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+# Edit Artist POST
+@pages.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    from forms import ArtistForm
+    form = ArtistForm(request.form)
+    try:
+        artist = Artist.query.filter(Artist.id == artist_id).one()
+        artist.name = form.name.data
+        artist.genres = Genre.get_or_create(form.genres.data)
+        artist.city = form.city.data
+        artist.state = form.state.data
+        artist.phone = form.phone.data
+        artist.facebook_link = form.facebook_link.data
+        artist.image_link = form.image_link.data
+        artist.update()
+        flash('Artist ' + request.form['name'] + ' was successfully updated!')
+    except Exception as e:
+        print(e)
+    return redirect(url_for('pages.show_artist', artist_id=artist_id))
+
+#  Create Artist GET
+@pages.route('/artists/create', methods=['GET'])
+def create_artist_form():
+    from forms import ArtistForm
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+# Create Artist POST
+@pages.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+    from forms import ArtistForm
+    artist_form = ArtistForm(request.form)
+    try:
+        new_artist = Artist(
+            name=artist_form.name.data,
+            genres=Genre.get_or_create(artist_form.genres.data),
+            city=artist_form.city.data,
+            state=artist_form.state.data,
+            phone=artist_form.phone.data,
+            facebook_link=artist_form.facebook_link.data,
+            image_link=artist_form.image_link.data
+        )
+        new_artist.add()
+    # on successful db insert, flash success
+        flash('Artist ' + request.form['name'] + ' was successfully listed!')
+    except Exception as ex:
+        flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
+        print(ex)
+    return render_template('pages/home.html')
+
+
+#  ----------------------------------------------------------------
+#  App route for Genres
+#  ----------------------------------------------------------------
+@pages.route('/genres/<name>')
+@page_cache.cached('venues', 'artists', args=('page', 'state', 'city', 'upcoming'))
+def show_genre(name):
+    genre = Genre.find(name)
+    if genre is None:
+        abort(404)
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    filters = {key: request.args[key] for key in ('state', 'city', 'upcoming')
+               if request.args.get(key)}
+    per_page = current_app.config['GENRE_PER_PAGE']
+    venues = genre.members(Venue, filters.get('state'), filters.get('city'),
+                           'upcoming' in filters, page, per_page)
+    artists = genre.members(Artist, filters.get('state'), filters.get('city'),
+                            'upcoming' in filters, page, per_page)
+    return render_template('pages/genre.html', genre=genre, venues=venues, artists=artists,
+                           page=page, filters=filters,
+                           has_next=len(venues) == per_page or len(artists) == per_page)
+
+
+#  ----------------------------------------------------------------
+#  App route for Shows
+#  ----------------------------------------------------------------
+@pages.route('/shows')
+@page_cache.cached('shows', args=('when', 'from', 'to', 'per_page', 'stream', 'after'))
+def shows():
+    filters, after, start, end, per_page = listing_arguments()
+    query = Show.listing(after, filters.get('when'), start, end).limit(per_page)
+
+    if 'stream' in filters:
+        # rows are pulled from a server-side cursor while the page renders;
+        # the query only starts once streaming does, in the session that
+        # stream_with_context provides
+        def stream_shows():
+            for row in db.session.execute(query.execution_options(yield_per=100)):
+                yield SHOW_CARD.convert(row)
+
+        data = stream_shows()
+        return Response(stream_with_context(stream_template(
+            'pages/shows.html', shows=data, per_page=per_page, filters=filters)))
+
+    data = SHOW_CARD.views(db.session.execute(query))
+    return render_template('pages/shows.html', shows=data, per_page=per_page, filters=filters)
+
+# What's on between two times, optionally in one city. Defaults to the
+# coming week.
+@pages.route('/shows/whats-on')
+@page_cache.cached('shows', 'venues', args=('from', 'to', 'city', 'state'))
+def whats_on():
+    filters = {key: request.args[key].strip() for key in ('from', 'to', 'city', 'state')
+               if request.args.get(key, '').strip()}
+    try:
+        start = datetime.fromisoformat(filters['from']) if 'from' in filters else \
+            datetime.combine(datetime.now().date(), datetime.min.time())
+        if not in_range(start):
+            abort(400)
+        end = datetime.fromisoformat(filters['to']) if 'to' in filters else \
+            start + timedelta(days=7)
+    except ValueError:
+        abort(400)
+    if not in_range(end) or end <= start or end - start > current_app.config['WHATS_ON_MAX_RANGE']:
+        abort(400)
+    limit = current_app.config['WHATS_ON_LIMIT']
+    data = SHOW_CARD.views(db.session.execute(Show.whats_on(
+        start, end, filters.get('city'), filters.get('state'), limit,
+        db.engine.dialect.name)))
+    return render_template('pages/whats_on.html', shows=data, start=start, end=end,
+                           filters=filters, truncated=len(data) == limit)
+
+# Create shows GET
+@pages.route('/shows/create')
+def create_shows():
+    from forms import ShowForm
+    # renders form. do not touch.
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+# Create Shows POST
+@pages.route('/shows/create', methods=['POST'])
+def create_show_submission():
+    from forms import ShowForm
+    show_form = ShowForm(request.form)
+    # TODO: insert form data as a new Venue record in the db, instead
+    # TODO: modify data to be the data object returned from db insertion
+    try:
+        new_show = Show(
+            artist_id=show_form.artist_id.data,
+            venue_id=show_form.venue_id.data,
+            start_time=show_form.start_time.data,
+            end_time=show_form.end_time.data
+        )
+        # the database refuses double bookings too (see Show.__table_args__);
+        # checking first tells the user which show is in the way
+        clash = booking_clash(new_show)
+        if clash is None:
+            new_show.add()
+    except IntegrityError:
+        # booked by a concurrent request since the check, or unknown ids
+        db.session.rollback()
+        clash = booking_clash(new_show)
+        if clash is None:
+            current_app.logger.exception('Show could not be listed')
+            flash('An error occurred  could not be listed.')
+            return render_template('pages/home.html')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Show could not be listed')
+        flash('An error occurred  could not be listed.')
+        return render_template('pages/home.html')
+
+    if clash is not None:
+        flash('The venue or artist is already booked from {:%Y-%m-%d %H:%M} to '
+              '{:%Y-%m-%d %H:%M}.'.format(clash.start_time, clash.end_time))
+        return render_template('forms/new_show.html', form=show_form)
+    # on successful db insert, flash success
+    flash('Show was successfully listed!')
+    return render_template('pages/home.html')
+
+# The first booking of the venue or artist of show that it overlaps, if any
+def booking_clash(show):
+    return db.session.execute(Show.bookings(
+        show.start_time, show_end(show.start_time, show.end_time),
+        show.venue_id, show.artist_id, dialect=db.engine.dialect.name, limit=1)).first()
+
+
+#  ----------------------------------------------------------------
+#  API
+#  ----------------------------------------------------------------
+@pages.route('/api/typeahead')
+def typeahead():
+    indexes = {'artist': artist_names, 'venue': venue_names}
+    kind = request.args.get('kind')
+    if kind not in indexes:
+        abort(400)
+    query = request.args.get('q', '').strip()
+    data = indexes[kind].lookup(query, current_app.config['TYPEAHEAD_LIMIT']) if query else []
+    return jsonify({'data': data})
+
+
+# Whether a venue and/or artist is free for all of [from, to), with the
+# shows in the way if not
+@pages.route('/api/availability')
+def availability():
+    venue_id = request.args.get('venue_id', type=int)
+    artist_id = request.args.get('artist_id', type=int)
+    try:
+        start = datetime.fromisoformat(request.args['from'])
+        end = datetime.fromisoformat(request.args['to'])
+    except (KeyError, ValueError):
+        abort(400)
+    if (venue_id is None and artist_id is None) or end <= start or not in_range(start, end):
+        abort(400)
+    clashes = db.session.execute(Show.bookings(
+        start, end, venue_id, artist_id, dialect=db.engine.dialect.name)).all()
+    return jsonify({'venue_id': venue_id, 'artist_id': artist_id,
+                    'from': start.isoformat(), 'to': end.isoformat(),
+                    'available': not clashes,
+                    'conflicts': [{'id': clash.id, 'venue_id': clash.venue_id,
+                                   'artist_id': clash.artist_id,
+                                   'start_time': clash.start_time.isoformat(),
+                                   'end_time': clash.end_time.isoformat()}
+                                  for clash in clashes]})
+
+
+@pages.route('/api/export')
+def export():
+    kind = request.args.get('kind')
+    file_format = request.args.get('format', 'jsonl')
+    if kind not in EXPORTS or file_format not in ('jsonl', 'csv'):
+        abort(400)
+    try:
+        since = parse_since(request.args.get('since'))
+    except ValueError:
+        abort(400)
+    compress = request.args.get('gzip') == '1'
+    filename = '{}.{}{}'.format(kind, file_format, '.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else (
+        'text/csv' if file_format == 'csv' else 'application/x-ndjson')
+    return Response(stream_with_context(export_chunks(kind, file_format, since, compress)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=' + filename})
+
+
+@pages.route('/api/cache/stats')
+def cache_stats():
+    return jsonify(page_cache.stats)
+
+
+@pages.route('/api/db/replicas')
+def replica_status():
+    return jsonify({'replicas': replica_router.status()})
@@ -0,0 +1,10 @@
+# ----------------------------------------------------------------------------#
+# Entry point for WSGI servers:
+#
+#   $ gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Web workers do not need the command line parts of the app.
+# ----------------------------------------------------------------------------#
+from app import create_app
+
+app = create_app(commands=False)